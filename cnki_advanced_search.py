@@ -1,10 +1,18 @@
+import argparse
 import asyncio
+import functools
 import nest_asyncio
 import requests
 import logging
 import random
+import threading
 from pyppeteer import launch
+from pyppeteer.errors import TimeoutError as PyppeteerTimeoutError
 from urllib.parse import urljoin
+from resource_blocking import ResourceBlocker, format_stats, new_stats
+from result_store import ResultStore
+from crawl_checkpoint import CrawlCheckpoint
+from cnki_http_search import CnkiHttpSearch, parse_detail_rows, has_result_list, build_article
 import time
 
 nest_asyncio.apply()
@@ -57,9 +65,103 @@ def generate_queries(keyword):
         queries.append(query)
     return queries
 
-all_queries = {}
-for kw in keywords:
-    all_queries[kw] = generate_queries(kw)
+CONTEXT_WORKERS = 4
+JOB_RETRIES = 2
+
+# Deadlines in milliseconds; page loads follow the grid XHR, these only bound a stall
+NAV_TIMEOUT = 30000
+SELECTOR_TIMEOUT = 20000
+RESULTS_TIMEOUT = 30000
+# How long rendered rows may lag behind the grid response (seconds)
+ROWS_SETTLE_TIMEOUT = 5
+PAGE_RETRIES = 2
+
+GRID_PATH = "/kns/Brief/GetGridTableHtml"
+
+# Rows already on the page are tagged so a re-render is told apart from the old grid
+MARK_ROWS_JS = """
+() => document.querySelectorAll('.result-detail-list dd, .result-table-list tbody tr')
+    .forEach(row => row.setAttribute('data-seen', '1'))
+"""
+NEW_ROWS_JS = """
+() => !!document.querySelector('.result-detail-list dd:not([data-seen]), .result-table-list tbody tr:not([data-seen])')
+"""
+
+# CNKI result rows rely on its stylesheet and icon font for visibility checks
+resource_blocker = ResourceBlocker(block_types={"image", "media"})
+
+# One round-trip per results page: every row's link, title and abstract
+EXTRACT_ROWS_JS = """
+() => Array.from(document.querySelectorAll('.result-detail-list dd h6 a')).map(a => {
+    const dd = a.closest('dd');
+    const abstract = dd ? dd.querySelector('div.middle > p.abstract') : null;
+    return {href: a.href, title: a.innerText, abstract: abstract ? abstract.textContent : ''};
+})
+"""
+
+# Fields each search prefix covers; TKA searches title, keywords and abstract,
+# so a TI or KY query can only return a subset of the matching TKA query
+FIELD_SCOPE = {
+    "TI": {"TI"},
+    "KY": {"KY"},
+    "TKA": {"TI", "KY", "AB"},
+}
+
+def template_field(template):
+    return template.split("=", 1)[0]
+
+def plan_templates(templates):
+    # Collapse the templates into the broadest ones that subsume them. A NOT
+    # variant is a subset of its plain query, so the server always runs the
+    # plain form; the title exclusion is applied locally only when every
+    # template folded into a planned query carried it.
+    fields = {template_field(t) for t in templates}
+    scope = lambda field: FIELD_SCOPE.get(field, {field})
+    groups = {}
+    for template in templates:
+        field = template_field(template)
+        covering = [f for f in fields if scope(field) <= scope(f)]
+        broadest = max(covering, key=lambda f: (len(scope(f)), f))
+        groups.setdefault(broadest, []).append(template)
+
+    plan = []
+    for broadest, group in groups.items():
+        widest = next(t for t in group if template_field(t) == broadest)
+        base = widest.split(" NOT ", 1)[0]
+        exclude_locally = all(" NOT " in t for t in group)
+        plan.append((base, exclude_locally))
+    return plan
+
+def plan_queries(keyword):
+    side_effects_str = " OR ".join(side_effects_keywords)
+    queries = []
+    for template, exclude_locally in plan_templates(query_templates):
+        query = template.format(keyword=keyword, keywords_with_side_effects=side_effects_str)
+        queries.append((query, list(exclude_keywords) if exclude_locally else []))
+    return queries
+
+def build_all_queries(naive=False):
+    all_queries = {}
+    for kw in keywords:
+        if naive:
+            all_queries[kw] = [(query, []) for query in generate_queries(kw)]
+        else:
+            all_queries[kw] = plan_queries(kw)
+    return all_queries
+
+def describe_plan(all_queries):
+    naive_count = len(keywords) * len(query_templates)
+    planned_count = sum(len(queries) for queries in all_queries.values())
+    lines = [f"Query plan: {planned_count} queries (naive: {naive_count})"]
+    for kw, queries in all_queries.items():
+        for query_text, exclude_terms in queries:
+            suffix = f"  [local title exclusion: {len(exclude_terms)} terms]" if exclude_terms else ""
+            lines.append(f"  {kw}: {query_text}{suffix}")
+    return "\n".join(lines)
+
+def is_excluded(article_data, exclude_terms):
+    title = article_data["ArticleTitle"]
+    return any(term and term in title for term in exclude_terms)
 
 def recognize_captcha(image_bytes):
     url = ""
@@ -76,13 +178,14 @@ def recognize_captcha(image_bytes):
 
 async def handle_captcha_if_present(page):
     try:
-        await page.waitForSelector('.verifycode', timeout=3000)
+        if not await page.querySelector('.verifycode'):
+            return False
         logging.info("Captcha detected. Starting to solve...")
 
         captcha_img_el = await page.querySelector('img#changeVercode')
         if not captcha_img_el:
             logging.info("captcha_img_el not found!")
-            return
+            return False
 
         captcha_src = await page.evaluate('(el) => el.getAttribute("src")', captcha_img_el)
         full_captcha_url = urljoin(page.url, captcha_src)
@@ -91,178 +194,340 @@ async def handle_captcha_if_present(page):
         resp = requests.get(full_captcha_url)
         if resp.status_code != 200:
             logging.warning("Failed to download captcha image.")
-            return
+            return False
 
         captcha_bytes = resp.content
         captcha_result = recognize_captcha(captcha_bytes)
         logging.info(f"Captcha recognized as: {captcha_result}")
 
         await page.type('#vericode', captcha_result)
-        await page.click('#checkCodeBtn')
-        await asyncio.sleep(2)
+        return await wait_for_new_rows(page, '#checkCodeBtn')
 
     except Exception as e:
         logging.info(f"No captcha or error in captcha handling: {e}")
-
-async def run_crawling():
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
-
-    user_agent = random.choice(USER_AGENTS)
-    browser = await launch(
+        return False
+
+class PageStalled(Exception):
+    pass
+
+async def click_into_view(page, selector):
+    await page.evaluate(f'document.querySelector("{selector}").scrollIntoView({{block: "center"}})')
+    await page.click(selector)
+
+async def wait_for_new_rows(page, selector, timeout=RESULTS_TIMEOUT):
+    # Clicks `selector` and returns as soon as fresh result rows are rendered.
+    # Returns False when the grid XHR answered but no rows followed (empty
+    # result or captcha); raises PageStalled if nothing happened in time.
+    await page.evaluate(MARK_ROWS_JS)
+    response_wait = asyncio.ensure_future(
+        page.waitForResponse(lambda response: GRID_PATH in response.url, {'timeout': timeout})
+    )
+    rows_wait = asyncio.ensure_future(
+        page.waitForFunction(NEW_ROWS_JS, {'polling': 'mutation', 'timeout': timeout})
+    )
+    try:
+        await click_into_view(page, selector)
+        pending = {response_wait, rows_wait}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if rows_wait in done and rows_wait.exception() is None:
+                return True
+            if response_wait in done and response_wait.exception() is None:
+                break
+        else:
+            raise PageStalled(f"No grid response or new rows within {timeout} ms")
+
+        response = response_wait.result()
+        if not response.ok:
+            raise PageStalled(f"Result grid returned HTTP {response.status}")
+        done, _ = await asyncio.wait({rows_wait}, timeout=ROWS_SETTLE_TIMEOUT)
+        return rows_wait in done and rows_wait.exception() is None
+    finally:
+        for task in (response_wait, rows_wait):
+            if not task.done():
+                task.cancel()
+
+async def load_results(page, selector):
+    # Stalled loads are retried; rows that turned up late count as loaded so a
+    # retried page turn never skips a page. Returns False only when the grid
+    # answered with no rows; anything else that never loads raises PageStalled.
+    for attempt in range(PAGE_RETRIES + 1):
+        if attempt and await page.evaluate(NEW_ROWS_JS):
+            return True
+        try:
+            if await wait_for_new_rows(page, selector):
+                return True
+            if not await page.querySelector('.verifycode'):
+                return False
+            if await handle_captcha_if_present(page):
+                return True
+            raise PageStalled("Captcha was not solved")
+        except (PageStalled, PyppeteerTimeoutError) as e:
+            logging.warning(f"Result page stalled (attempt {attempt + 1}): {e}")
+            print(f"Result page stalled (attempt {attempt + 1}): {e}")
+    raise PageStalled(f"{selector} did not load after {PAGE_RETRIES + 1} attempts")
+
+async def launch_browser():
+    return await launch(
         headless=True, 
         executablePath=r"C:\Program Files\Google\Chrome\Application\chrome.exe",
         args=['--start-maximized']
     )
-    page = await browser.newPage()
-    await page.setUserAgent(user_agent)
-
-    seen_results = set()
-
-    for kw, queries in all_queries.items():
-        logging.info(f"\n=== Keyword: {kw} ===")
-        print(f"\n=== Keyword: {kw} ===")
 
-        keyword_results = []
-
-        for query_text in queries:
-            logging.info(f"  Testing Query: {query_text}")
-            print(f"  Testing Query: {query_text}")
-
-            url = "https://chn.oversea.cnki.net/kns/AdvSearch?dbcode=CFLS&crossDbcodes=CJFQ,CDMD,CIPD,CCND,CYFD,CCJD,BDZK,CISD,SNAD,CJFN"
-            await page.goto(url, timeout=0)
-
-            await page.waitForSelector('li[name="majorSearch"]', timeout=0)
-            await page.click('li[name="majorSearch"]')
-
-            await page.waitForSelector('.textarea-major', timeout=0)
-            text_area = await page.querySelector('.textarea-major')
+async def close_quietly(target):
+    try:
+        await target.close()
+    except Exception as e:
+        logging.debug(f"Error while closing: {e}")
+
+# One Chromium shared by all workers; each worker gets its own incognito
+# context and page, and a browser that stops handing out contexts is relaunched
+class SharedBrowser:
+    def __init__(self):
+        self.browser = None
+        self.launches = 0
+        self.lock = asyncio.Lock()
+
+    async def _relaunch(self, stale):
+        async with self.lock:
+            # Another worker may already have replaced it
+            if self.browser is stale:
+                if stale is not None:
+                    await close_quietly(stale)
+                self.browser = await launch_browser()
+                self.launches += 1
+
+    async def _open(self, user_agent):
+        context = await self.browser.createIncognitoBrowserContext()
+        page = await context.newPage()
+        await page.setUserAgent(user_agent)
+        blocking_stats = await resource_blocker.attach(page)
+        return context, page, blocking_stats
+
+    async def new_page(self, user_agent):
+        if self.browser is None:
+            await self._relaunch(None)
+        browser = self.browser
+        try:
+            return await self._open(user_agent)
+        except Exception as e:
+            logging.warning(f"Browser unusable, relaunching: {e}")
+            await self._relaunch(browser)
+            return await self._open(user_agent)
+
+    async def close(self):
+        if self.browser is not None:
+            await close_quietly(self.browser)
+
+async def crawl_query_with_browser(page, kw, query_text, start_page, on_page):
+    url = "https://chn.oversea.cnki.net/kns/AdvSearch?dbcode=CFLS&crossDbcodes=CJFQ,CDMD,CIPD,CCND,CYFD,CCJD,BDZK,CISD,SNAD,CJFN"
+    await page.goto(url, timeout=NAV_TIMEOUT, waitUntil='domcontentloaded')
+
+    await page.waitForSelector('li[name="majorSearch"]', timeout=SELECTOR_TIMEOUT)
+    await page.click('li[name="majorSearch"]')
+
+    await page.waitForSelector('.textarea-major', timeout=SELECTOR_TIMEOUT)
+    text_area = await page.querySelector('.textarea-major')
+
+    await text_area.click({'clickCount': 3})
+    for _ in range(5):
+        await text_area.press('Backspace')
+    await text_area.type(query_text)
+
+    await page.waitForSelector('.btn-search', timeout=SELECTOR_TIMEOUT)
+    if not await load_results(page, '.btn-search'):
+        logging.info("    No results for query.")
+        print("    No results for query.")
+        return
 
-            await text_area.click({'clickCount': 3})
-            for _ in range(5):
-                await text_area.press('Backspace')
-            await text_area.type(query_text)
+    try:
+        await page.waitForSelector('i.icon-detail', visible=True, timeout=SELECTOR_TIMEOUT)
+        if not await load_results(page, 'i.icon-detail'):
+            raise PageStalled("Detail view did not load")
+    except Exception as e:
+        # Retried as a new job instead of marking the query finished
+        logging.warning(f"Detail icon not found or timed out: {e}")
+        print(f"Detail icon not found or timed out: {e}")
+        raise
 
-            await page.waitForSelector('.btn-search', timeout=60000)
-            await page.click('.btn-search')
+    try:
+        total_results_text = await page.evaluate(
+            'document.querySelector(".pagerTitleCell em") ? document.querySelector(".pagerTitleCell em").innerText : null'
+        )
+        if total_results_text:
+            total_results = int(total_results_text.strip())
+            total_pages = (total_results // 20) + (1 if (total_results % 20 != 0) else 0)
+        else:
+            total_pages = 1
+
+        logging.info(f"Total Pages: {total_pages}")
+        print(f"Total Pages: {total_pages}")
+    except Exception as e:
+        logging.error(f"Error determining total pages: {e}")
+        print(f"Error determining total pages: {e}")
+        total_pages = 1
 
-            await handle_captcha_if_present(page)
+    page_number = 1
+    while page_number <= total_pages:
+        # Pages finished by an earlier run are only paged through
+        if page_number >= start_page:
+            logging.info(f"\n=== Page {page_number} ===")
+            print(f"\n=== Page {page_number} ===")
 
             try:
-                await page.waitForSelector('i.icon-detail', visible=True, timeout=160000)
-                await page.evaluate('document.querySelector("i.icon-detail").scrollIntoView({block: "center"})')
-                await page.click('i.icon-detail')
-                await asyncio.sleep(2)
+                rows = await page.evaluate(EXTRACT_ROWS_JS)
             except Exception as e:
-                logging.warning(f"Detail icon not found or timed out: {e}")
-                print(f"Detail icon not found or timed out: {e}")
-                continue
-
+                logging.error(f"Error extracting article info: {e}")
+                print(f"Error extracting article info: {e}")
+                raise
+            if not rows:
+                logging.info("    No results found, moving to next page.")
+                print("    No results found, moving to next page.")
+                break
+
+            on_page(page_number, [
+                build_article(kw, query_text, row["title"], row["href"], row["abstract"])
+                for row in rows
+            ])
+
+        page_number += 1
+        if page_number <= total_pages:
             try:
-                total_results_text = await page.evaluate(
-                    'document.querySelector(".pagerTitleCell em") ? document.querySelector(".pagerTitleCell em").innerText : null'
-                )
-                if total_results_text:
-                    total_results = int(total_results_text.strip())
-                    total_pages = (total_results // 20) + (1 if (total_results % 20 != 0) else 0)
-                else:
-                    total_pages = 1
-
-                logging.info(f"Total Pages: {total_pages}")
-                print(f"Total Pages: {total_pages}")
+                if not await load_results(page, '#PageNext'):
+                    raise PageStalled(f"Page {page_number} did not load")
             except Exception as e:
-                logging.error(f"Error determining total pages: {e}")
-                print(f"Error determining total pages: {e}")
-                total_pages = 1
-
-            page_number = 1
-            while page_number <= total_pages:
-                logging.info(f"\n=== Page {page_number} ===")
-                print(f"\n=== Page {page_number} ===")
+                # Retried as a new job, which resumes from the checkpoint
+                logging.warning(f"Error navigating to next page: {e}")
+                print(f"Error navigating to next page: {e}")
+                raise
+
+def crawl_query_over_http(http_search, kw, query_text, start_page, on_page):
+    for page_number, tree in http_search.iter_pages(query_text, start_page=start_page):
+        page_articles = parse_detail_rows(tree, kw, query_text)
+        logging.info(f"HTTP page {page_number}: {len(page_articles)} rows")
+        if not page_articles:
+            if page_number == 1 and not has_result_list(tree):
+                # Not a result page we understand; let the browser handle it
+                raise ValueError("Unexpected result page layout")
+            break
+        on_page(page_number, page_articles)
+
+async def run_crawling(all_queries):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    logging.info(describe_plan(all_queries))
 
+    loop = asyncio.get_event_loop()
+    jobs = asyncio.Queue()
+    for kw, queries in all_queries.items():
+        for query_text, exclude_terms in queries:
+            jobs.put_nowait((kw, query_text, exclude_terms, 0))
+
+    # The browser is only started if the HTTP backend fails
+    shared_browser = SharedBrowser()
+    store = ResultStore()
+    checkpoint = CrawlCheckpoint()
+    seen_results = checkpoint.seen_keys()
+    keyword_counts = {kw: 0 for kw in all_queries}
+    keyword_counts.update(checkpoint.keyword_counts())
+    if seen_results:
+        logging.info(f"Resuming with {len(seen_results)} articles already saved")
+    # HTTP pages are saved from executor threads
+    save_lock = threading.Lock()
+
+    def save_page(kw, query_text, exclude_terms, page_number, articles):
+        with save_lock:
+            new_keys = save_articles(kw, query_text, exclude_terms, articles)
+            store.flush()
+            checkpoint.complete_page(kw, query_text, page_number, new_keys)
+
+    def save_articles(kw, query_text, exclude_terms, articles):
+        new_keys = []
+        for article_data in articles:
+            if is_excluded(article_data, exclude_terms):
+                logging.info(f"Excluded by title, skipping: {article_data['ArticleTitle']}")
+                continue
+            key = (article_data["ArticleTitle"], article_data["Link"])
+            if key not in seen_results:
+                seen_results.add(key)
+                new_keys.append(key)
+                keyword_counts[kw] += 1
+                store.add(
+                    "cnki", article_data["PMID"] or article_data["Link"],
+                    title=article_data["ArticleTitle"], abstract=article_data["AbstractText"],
+                    link=article_data["Link"], query=query_text, raw=article_data
+                )
+                logging.info(f"Saved: {article_data}")
+                print(f"Saved: {article_data}")
+            else:
+                logging.info(f"Duplicate found, skipping: {article_data}")
+                print(f"Duplicate found, skipping: {article_data}")
+        return new_keys
+
+    async def worker(worker_id):
+        user_agent = random.choice(USER_AGENTS)
+        http_search = CnkiHttpSearch(user_agent)
+        context = page = blocking_stats = None
+        while not jobs.empty():
+            kw, query_text, exclude_terms, attempt = jobs.get_nowait()
+            if checkpoint.start_page(kw, query_text) is None:
+                logging.info(f"  [worker {worker_id}] Already completed, skipping: {query_text}")
+                continue
+            on_page = functools.partial(save_page, kw, query_text, exclude_terms)
+            logging.info(f"  [worker {worker_id}] Keyword: {kw}, Testing Query: {query_text}")
+            print(f"  [worker {worker_id}] Keyword: {kw}, Testing Query: {query_text}")
+            try:
                 try:
-                    await page.waitForSelector('.result-detail-list', timeout=160000)
+                    await loop.run_in_executor(
+                        None, crawl_query_over_http, http_search, kw, query_text,
+                        checkpoint.start_page(kw, query_text), on_page
+                    )
                 except Exception as e:
-                    logging.warning(f"Error waiting for results: {e}")
-                    print(f"Error waiting for results: {e}")
-                    break
-
-                result_elements = await page.querySelectorAll('.result-detail-list dd h6 a')
-                if not result_elements:
-                    logging.info("    No results found, moving to next page.")
-                    print("    No results found, moving to next page.")
-                    break
-
-                for element in result_elements:
-                    try:
-                        raw_link = await page.evaluate('(el) => el.href', element)
-                        title_text = await (await element.getProperty('innerText')).jsonValue()
-
-                        filename = await page.evaluate('(link) => new URL(link).searchParams.get("FileName")', raw_link)
-                        dbcode = await page.evaluate('(link) => new URL(link).searchParams.get("DbCode")', raw_link)
-                        dbname = await page.evaluate('(link) => new URL(link).searchParams.get("DbName")', raw_link)
-
-                        if filename and dbcode and dbname:
-                            full_url = (
-                                f"https://chn.oversea.cnki.net/KCMS/detail/detail.aspx"
-                                f"?dbcode={dbcode}&dbname={dbname}&filename={filename}"
-                            )
-                        else:
-                            full_url = raw_link
-
-                        abstract_text = ""
-                        parent_dd = await element.xpath('ancestor::dd[1]')
-                        if parent_dd:
-                            abstract_element = await parent_dd[0].querySelector('div.middle > p.abstract')
-                            if abstract_element:
-                                abstract_text = await (await abstract_element.getProperty('textContent')).jsonValue()
-                                abstract_text = abstract_text.strip()
-                                if abstract_text.startswith("摘要："):
-                                    abstract_text = abstract_text.replace("摘要：", "").strip()
-
-                        article_data = {
-                            "Keyword": kw,
-                            "Query": query_text,
-                            "ArticleTitle": title_text,
-                            "Link": full_url,
-                            "PMID": filename,
-                            "AbstractText": abstract_text,
-                        }
-
-                        if (title_text, full_url) not in seen_results:
-                            seen_results.add((title_text, full_url))
-                            keyword_results.append(article_data)
-                            logging.info(f"Saved: {article_data}")
-                            print(f"Saved: {article_data}")
-                        else:
-                            logging.info(f"Duplicate found, skipping: {article_data}")
-                            print(f"Duplicate found, skipping: {article_data}")
-
-                    except Exception as e:
-                        logging.error(f"Error extracting article info: {e}")
-                        print(f"Error extracting article info: {e}")
-
-                page_number += 1
-                if page_number <= total_pages:
-                    try:
-                        await page.evaluate('document.querySelector("#PageNext").scrollIntoView({block: "center"})')
-                        await page.click('#PageNext')
-                        await asyncio.sleep(2)
-                        await handle_captcha_if_present(page)
-                    except Exception as e:
-                        logging.warning(f"Error navigating to next page: {e}")
-                        print(f"Error navigating to next page: {e}")
-                        break
-
-        logging.info(f"Keyword [{kw}] done, results count: {len(keyword_results)}")
-        print(f"Keyword [{kw}] done, results count: {len(keyword_results)}")
+                    logging.warning(f"HTTP search failed, falling back to browser: {e}")
+                    print(f"HTTP search failed, falling back to browser: {e}")
+                    if page is None:
+                        context, page, blocking_stats = await shared_browser.new_page(user_agent)
+                    await crawl_query_with_browser(page, kw, query_text, checkpoint.start_page(kw, query_text), on_page)
+                    logging.info(f"  [worker {worker_id}] {format_stats(blocking_stats)}")
+                    blocking_stats.update(new_stats())
+            except Exception as e:
+                logging.error(f"[worker {worker_id}] Query failed (attempt {attempt + 1}): {e}")
+                print(f"[worker {worker_id}] Query failed (attempt {attempt + 1}): {e}")
+                # Start the next job from a fresh context in case this one crashed
+                if context is not None:
+                    await close_quietly(context)
+                context = page = blocking_stats = None
+                if attempt < JOB_RETRIES:
+                    jobs.put_nowait((kw, query_text, exclude_terms, attempt + 1))
+                continue
+            checkpoint.finish_query(kw, query_text)
+        if context is not None:
+            await close_quietly(context)
+
+    await asyncio.gather(*(worker(i) for i in range(CONTEXT_WORKERS)))
+
+    for kw, count in keyword_counts.items():
+        logging.info(f"Keyword [{kw}] done, results count: {count}")
+        print(f"Keyword [{kw}] done, results count: {count}")
 
     logging.info(f"\n=== All done. Total unique articles: {len(seen_results)} ===")
     print(f"\n=== All done. Total unique articles: {len(seen_results)} ===")
+    logging.info(f"Browser launches: {shared_browser.launches}")
 
-    await browser.close()
+    store.close()
+    checkpoint.close()
+    await shared_browser.close()
 
 def main():
-    asyncio.run(run_crawling())
+    parser = argparse.ArgumentParser(description="CNKI professional search crawler")
+    parser.add_argument("--plan", action="store_true", help="Print the planned vs. naive queries and exit")
+    parser.add_argument("--naive", action="store_true", help="Run every template query instead of the reduced plan")
+    args = parser.parse_args()
+
+    all_queries = build_all_queries(args.naive)
+    if args.plan:
+        print(describe_plan(all_queries))
+        return
+    asyncio.run(run_crawling(all_queries))
 
 if __name__ == "__main__":
     main()
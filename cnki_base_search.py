@@ -1,68 +1,102 @@
 import asyncio
 import nest_asyncio
 from pyppeteer import launch
+from resource_blocking import ResourceBlocker, format_stats
+from cnki_http_search import CnkiHttpSearch, parse_table_rows, has_result_list, build_detail_link, ADV_SEARCH_URL
+from result_store import ResultStore
 
 nest_asyncio.apply()
 
+SEARCH_TEXT = ''
+QUERY_TEXT = f'FT=("{SEARCH_TEXT}")'
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko)"
+
+def print_row(row):
+    print(f"Title: {row['title']}")
+    print(f"Link: {row['link']}")
+    print(f"Authors: {row['author']}")
+    print(f"Source: {row['source']}")
+    print(f"Publication Date: {row['date']}")
+    print(f"Download Count: {row['download_count']}")
+    print("-" * 50)
+
+def save_rows(store, rows):
+    for row in rows:
+        print_row(row)
+        # Same (source, id) as cnki_advanced_search so both crawlers share rows
+        link, filename = build_detail_link(row['link'])
+        store.add(
+            "cnki", filename or link,
+            title=row['title'], link=link, date=row['date'], query=QUERY_TEXT, raw=row
+        )
+
+def search_over_http():
+    # The full-text (FT) expert query the browser fallback types, posted straight to the result grid
+    tree = CnkiHttpSearch(USER_AGENT).fetch_page(QUERY_TEXT, display_mode="listmode")
+    rows = parse_table_rows(tree)
+    if not rows and not has_result_list(tree):
+        raise ValueError("Unexpected result page layout")
+    return rows
+
+EXTRACT_ROWS_JS = """
+() => Array.from(document.querySelectorAll('.result-table-list tbody tr')).map(tr => {
+    const text = (selector) => {
+        const el = tr.querySelector(selector);
+        return el ? el.innerText : '';
+    };
+    const title = tr.querySelector('.name a');
+    return {
+        title: title ? title.innerText : '',
+        link: title ? title.href : '',
+        author: text('.author'),
+        source: text('.source'),
+        date: text('.date'),
+        download_count: text('.download .downloadCnt'),
+    };
+})
+"""
+
 async def main():
+    store = ResultStore()
+    try:
+        await search(store)
+    finally:
+        store.close()
+
+async def search(store):
+    try:
+        rows = search_over_http()
+    except Exception as e:
+        print(f"HTTP search failed, falling back to browser: {e}")
+    else:
+        save_rows(store, rows)
+        return
+
     browser = await launch(
         headless=True,
         executablePath=r"C:\Program Files\Google\Chrome\Application\chrome.exe"
     )
     page = await browser.newPage()
+    blocking_stats = await ResourceBlocker(block_types={"image", "media"}).attach(page)
 
-    await page.goto("https://kns.cnki.net/kns", timeout=60000)
+    # Same site, databases and expert query as the HTTP path, so results do
+    # not depend on which path ran
+    await page.goto(ADV_SEARCH_URL, timeout=60000)
 
-    await page.waitForSelector('.sort-default', timeout=10000)
-    await page.click('.sort-default')
-    await page.waitForSelector('.sort-list li[data-val="FT"] a', timeout=10000)
-    await page.click('.sort-list li[data-val="FT"] a')
+    await page.waitForSelector('li[name="majorSearch"]', timeout=10000)
+    await page.click('li[name="majorSearch"]')
 
-    await page.waitForSelector('#txt_search', timeout=10000)
-    await page.type('#txt_search', '')
+    await page.waitForSelector('.textarea-major', timeout=10000)
+    await page.type('.textarea-major', QUERY_TEXT)
 
-    await page.waitForSelector('input.search-btn', timeout=10000)
-    await page.click('input.search-btn')
+    await page.waitForSelector('.btn-search', timeout=10000)
+    await page.click('.btn-search')
 
     await page.waitForSelector('.result-table-list', timeout=60000)
 
-    result_elements = await page.querySelectorAll('.result-table-list tbody tr')
-
-    for element in result_elements:
-        title_element = await element.querySelector('.name a')
-        title_text = ""
-        link = ""
-        if title_element:
-            title_text = await (await title_element.getProperty('innerText')).jsonValue()
-            link = await (await title_element.getProperty('href')).jsonValue()
-
-        author_element = await element.querySelector('.author')
-        author_text = ""
-        if author_element:
-            author_text = await (await author_element.getProperty('innerText')).jsonValue()
-
-        source_element = await element.querySelector('.source')
-        source_text = ""
-        if source_element:
-            source_text = await (await source_element.getProperty('innerText')).jsonValue()
-
-        date_element = await element.querySelector('.date')
-        date_text = ""
-        if date_element:
-            date_text = await (await date_element.getProperty('innerText')).jsonValue()
-
-        download_element = await element.querySelector('.download .downloadCnt')
-        download_count = ""
-        if download_element:
-            download_count = await (await download_element.getProperty('innerText')).jsonValue()
-
-        print(f"Title: {title_text}")
-        print(f"Link: {link}")
-        print(f"Authors: {author_text}")
-        print(f"Source: {source_text}")
-        print(f"Publication Date: {date_text}")
-        print(f"Download Count: {download_count}")
-        print("-" * 50)
+    save_rows(store, await page.evaluate(EXTRACT_ROWS_JS))
+
+    print(format_stats(blocking_stats))
 
     await asyncio.sleep(5)
 
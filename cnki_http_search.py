@@ -0,0 +1,183 @@
+import json
+import logging
+from urllib.parse import urljoin, urlparse, parse_qs
+import requests
+from lxml import html as lxml_html
+
+BASE_URL = "https://chn.oversea.cnki.net"
+ADV_SEARCH_URL = BASE_URL + "/kns/AdvSearch?dbcode=CFLS&crossDbcodes=CJFQ,CDMD,CIPD,CCND,CYFD,CCJD,BDZK,CISD,SNAD,CJFN"
+GRID_URL = BASE_URL + "/kns/Brief/GetGridTableHtml"
+DETAIL_URL = BASE_URL + "/KCMS/detail/detail.aspx"
+DB_CODE = "CFLS"
+CROSS_DB_CODES = "CJFQ,CDMD,CIPD,CCND,CYFD,CCJD,BDZK,CISD,SNAD,CJFN"
+PAGE_SIZE = 20
+REQUEST_TIMEOUT = 30
+
+
+class CaptchaRequired(Exception):
+    pass
+
+
+def has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+def clean_text(text):
+    return " ".join(text.split())
+
+
+def build_detail_link(raw_link):
+    # Rebuild the canonical detail URL from the FileName/DbCode/DbName query params
+    params = parse_qs(urlparse(raw_link).query)
+    filename = params.get("FileName", [None])[0]
+    dbcode = params.get("DbCode", [None])[0]
+    dbname = params.get("DbName", [None])[0]
+    if filename and dbcode and dbname:
+        return f"{DETAIL_URL}?dbcode={dbcode}&dbname={dbname}&filename={filename}", filename
+    return raw_link, filename
+
+
+def parse_total_pages(tree):
+    counts = tree.xpath(f"//*[{has_class('pagerTitleCell')}]//em/text()")
+    if not counts:
+        return 1
+    total_results = int(counts[0].strip().replace(",", "") or 0)
+    return max(1, (total_results + PAGE_SIZE - 1) // PAGE_SIZE)
+
+
+def has_result_list(tree):
+    return bool(tree.xpath(f"//*[{has_class('result-detail-list')} or {has_class('result-table-list')}]"))
+
+
+def build_article(keyword, query_text, title, raw_link, abstract_text):
+    full_url, filename = build_detail_link(raw_link)
+    abstract_text = abstract_text.strip()
+    if abstract_text.startswith("摘要："):
+        abstract_text = abstract_text.replace("摘要：", "").strip()
+    return {
+        "Keyword": keyword,
+        "Query": query_text,
+        "ArticleTitle": clean_text(title),
+        "Link": full_url,
+        "PMID": filename,
+        "AbstractText": abstract_text,
+    }
+
+
+def parse_detail_rows(tree, keyword, query_text, base_url=BASE_URL):
+    articles = []
+    for dd in tree.xpath(f"//*[{has_class('result-detail-list')}]//dd"):
+        anchors = dd.xpath(".//h6//a")
+        if not anchors:
+            continue
+        abstracts = dd.xpath(f".//div[{has_class('middle')}]/p[{has_class('abstract')}]")
+        articles.append(build_article(
+            keyword,
+            query_text,
+            anchors[0].text_content(),
+            urljoin(base_url, anchors[0].get("href", "")),
+            abstracts[0].text_content() if abstracts else ""
+        ))
+    return articles
+
+
+def parse_table_rows(tree, base_url=BASE_URL):
+    rows = []
+    for tr in tree.xpath(f"//*[{has_class('result-table-list')}]//tbody/tr"):
+        def cell(name):
+            found = tr.xpath(f".//*[{has_class(name)}]")
+            return clean_text(found[0].text_content()) if found else ""
+
+        anchors = tr.xpath(f".//*[{has_class('name')}]//a")
+        downloads = tr.xpath(f".//*[{has_class('download')}]//*[{has_class('downloadCnt')}]")
+        rows.append({
+            "title": clean_text(anchors[0].text_content()) if anchors else "",
+            "link": urljoin(base_url, anchors[0].get("href", "")) if anchors else "",
+            "author": cell("author"),
+            "source": cell("source"),
+            "date": cell("date"),
+            "download_count": clean_text(downloads[0].text_content()) if downloads else "",
+        })
+    return rows
+
+
+class CnkiHttpSearch:
+    # Posts professional-search (majorSearch) queries straight to the result
+    # grid endpoint the search page itself calls, and returns parsed HTML.
+
+    def __init__(self, user_agent):
+        self.session = requests.Session()
+        self.session.headers.update({
+            "User-Agent": user_agent,
+            "Referer": ADV_SEARCH_URL,
+            "X-Requested-With": "XMLHttpRequest",
+        })
+        self._primed = False
+
+    def _prime(self):
+        # The grid endpoint expects the cookies set by the search page
+        if not self._primed:
+            self.session.get(ADV_SEARCH_URL, timeout=REQUEST_TIMEOUT).raise_for_status()
+            self._primed = True
+
+    def _query_json(self, query_text):
+        return json.dumps({
+            "Platform": "",
+            "DBCode": DB_CODE,
+            "KuaKuCode": CROSS_DB_CODES,
+            "QNode": {
+                "QGroup": [{
+                    "Key": "Subject",
+                    "Title": "",
+                    "Logic": 0,
+                    "Items": [{
+                        "Key": "Expert",
+                        "Title": "",
+                        "Logic": 0,
+                        "Name": "",
+                        "Operate": "",
+                        "Value": query_text,
+                        "ExtendType": 12,
+                        "ExtendValue": "中英文对照",
+                        "Value2": "",
+                        "BlurType": "",
+                    }],
+                    "ChildItems": [],
+                }]
+            },
+        }, ensure_ascii=False)
+
+    def fetch_page(self, query_text, page_num=1, search_sql=None, display_mode="detailmode", sort_field=""):
+        self._prime()
+        form = {
+            "IsSearch": "true" if search_sql is None else "false",
+            "QueryJson": self._query_json(query_text),
+            "PageName": "AdvSearch",
+            "DBCode": DB_CODE,
+            "KuaKuCodes": CROSS_DB_CODES,
+            "CurPage": page_num,
+            "RecordsCntPerPage": PAGE_SIZE,
+            "CurDisplayMode": display_mode,
+            "CurrSortField": sort_field,
+            "CurrSortFieldType": "desc",
+            "IsSentenceSearch": "false",
+            "Subject": "",
+        }
+        if search_sql:
+            form["SearchSql"] = search_sql
+        resp = self.session.post(GRID_URL, data=form, timeout=REQUEST_TIMEOUT)
+        resp.raise_for_status()
+        if "verifycode" in resp.text or "changeVercode" in resp.text:
+            raise CaptchaRequired(f"Captcha requested for page {page_num}")
+        return lxml_html.fromstring(resp.text or "<div></div>")
+
+    def iter_pages(self, query_text, display_mode="detailmode", sort_field="", start_page=1):
+        tree = self.fetch_page(query_text, display_mode=display_mode, sort_field=sort_field)
+        total_pages = parse_total_pages(tree)
+        # Later pages reuse the server-side query the first response hands back
+        search_sql = (tree.xpath("//input[@id='sqlVal']/@value") or [None])[0]
+        logging.info(f"HTTP search: {total_pages} pages for {query_text}")
+        if start_page <= 1:
+            yield 1, tree
+        for page_num in range(max(2, start_page), total_pages + 1):
+            yield page_num, self.fetch_page(query_text, page_num, search_sql, display_mode, sort_field)
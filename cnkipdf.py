@@ -5,17 +5,22 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
 import os
 import time
 import shutil
 import tempfile
-from PyPDF2 import PdfReader
+import threading
+import contextlib
+from pdf_validator import PdfValidator
+from download_manifest import DownloadManifest, file_digest
 import pandas as pd
 from tqdm import tqdm
 import cv2
 import numpy as np
 from PIL import Image
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
+from download_watcher import shared_watcher, format_download
 
 logging.basicConfig(
     level=logging.INFO,
@@ -26,26 +31,220 @@ logging.basicConfig(
     ]
 )
 
+MAX_WORKERS = 10
+# A Firefox session is replaced after this many jobs, or sooner if it fails
+DRIVER_MAX_DOWNLOADS = 50
+DOWNLOAD_TIMEOUT = 60
+# The full PyPDF2 parse is optional and runs in a process pool
+DEEP_PDF_CHECK = False
+
+pdf_validator = PdfValidator(deep=DEEP_PDF_CHECK)
+FIREFOX_BINARY = "C:\\Program Files\\Mozilla Firefox\\firefox.exe"
+
+def firefox_options(download_dir):
+    firefox_options = Options()
+    firefox_options.set_preference("browser.download.folderList", 2)
+    firefox_options.set_preference("browser.download.dir", download_dir)
+    firefox_options.set_preference("browser.download.useDownloadDir", True)
+    firefox_options.set_preference("browser.helperApps.neverAsk.saveToDisk", "application/pdf")
+    firefox_options.set_preference("pdfjs.disabled", True)
+    firefox_options.binary_location = FIREFOX_BINARY
+    return firefox_options
+
+class DriverSession:
+    def __init__(self):
+        self.download_dir = tempfile.mkdtemp(prefix="cnkipdf_")
+        try:
+            self.driver = webdriver.Firefox(options=firefox_options(self.download_dir))
+        except Exception:
+            shutil.rmtree(self.download_dir, ignore_errors=True)
+            raise
+        self.jobs = 0
+        self.failed = False
+        # PNG bytes of the last failed hover/click, kept per worker for debugging
+        self.error_screenshot = None
+
+    def is_healthy(self):
+        try:
+            self.driver.execute_script("return document.readyState")
+            return len(self.driver.window_handles) > 0
+        except Exception as e:
+            logging.warning(f"Firefox session unhealthy: {str(e)}")
+            return False
+
+    def reset(self):
+        # Leftovers from the previous job must not be mistaken for this job's download
+        for name in os.listdir(self.download_dir):
+            path = os.path.join(self.download_dir, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+        handles = self.driver.window_handles
+        for handle in handles[1:]:
+            self.driver.switch_to.window(handle)
+            self.driver.close()
+        self.driver.switch_to.window(handles[0])
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception as e:
+            logging.debug(f"Error quitting Firefox: {str(e)}")
+        shutil.rmtree(self.download_dir, ignore_errors=True)
+
+class DriverPool:
+    # One reusable Firefox per worker thread
+    def __init__(self, max_downloads=DRIVER_MAX_DOWNLOADS):
+        self.max_downloads = max_downloads
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.sessions = set()
+        self.stats = {"launches": 0, "reuses": 0, "recycles": 0}
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def _retire(self, session):
+        with self.lock:
+            self.sessions.discard(session)
+        session.quit()
+        self.local.session = None
+
+    def _acquire(self):
+        session = getattr(self.local, "session", None)
+        if session is not None:
+            if session.failed or session.jobs >= self.max_downloads or not session.is_healthy():
+                self._retire(session)
+                self._count("recycles")
+                session = None
+            else:
+                try:
+                    session.reset()
+                    self._count("reuses")
+                    return session
+                except Exception as e:
+                    logging.warning(f"Failed to reset Firefox session: {str(e)}")
+                    self._retire(session)
+                    self._count("recycles")
+        start = time.time()
+        session = DriverSession()
+        self._count("launches")
+        logging.info(f"Started Firefox in {time.time() - start:.1f}s")
+        with self.lock:
+            self.sessions.add(session)
+        self.local.session = session
+        return session
+
+    @contextlib.contextmanager
+    def session(self):
+        session = self._acquire()
+        try:
+            yield session
+        except Exception:
+            session.failed = True
+            raise
+        finally:
+            session.jobs += 1
+
+    def report(self):
+        acquired = self.stats["launches"] + self.stats["reuses"]
+        reuse_rate = self.stats["reuses"] / acquired if acquired else 0.0
+        return (
+            f"Firefox sessions started: {self.stats['launches']}, reused: {self.stats['reuses']} "
+            f"({reuse_rate:.0%}), recycled: {self.stats['recycles']}"
+        )
+
+    def close(self):
+        with self.lock:
+            sessions = list(self.sessions)
+            self.sessions.clear()
+        for session in sessions:
+            session.quit()
+
 def verify_pdf(file_path):
     try:
-        with open(file_path, "rb") as f:
-            if f.read(4) != b'%PDF':
-                print(f"[{time.strftime('%H:%M:%S')}] Error: Not a valid PDF")
-                logging.error(f"Not a valid PDF: {file_path}")
-                return False
-            pdf = PdfReader(file_path, strict=False)
-            print(f"[{time.strftime('%H:%M:%S')}] PDF verified, pages: {len(pdf.pages)}")
-            logging.info(f"PDF verified, pages: {len(pdf.pages)} for {file_path}")
-            return True
+        state = pdf_validator.validate(file_path)
     except Exception as e:
         print(f"[{time.strftime('%H:%M:%S')}] Error verifying PDF: {str(e)}")
         logging.error(f"Error verifying PDF: {str(e)} for {file_path}")
         return False
+    if state != "ok":
+        print(f"[{time.strftime('%H:%M:%S')}] Error: Not a valid PDF ({state})")
+        logging.error(f"Not a valid PDF ({state}): {file_path}")
+        return False
+    print(f"[{time.strftime('%H:%M:%S')}] PDF verified")
+    logging.info(f"PDF verified: {file_path}")
+    return True
+
+# Finds the visible .btn-download and whether it (or its content) is painted
+# green, the colour CNKI uses for downloadable full text. The hue/saturation/value
+# bounds match the HSV range of the old screenshot scan.
+DOWNLOAD_BUTTON_JS = """
+const isVisible = el => {
+    const style = getComputedStyle(el);
+    const rect = el.getBoundingClientRect();
+    return style.display !== 'none' && style.visibility !== 'hidden'
+        && parseFloat(style.opacity) > 0 && rect.width > 0 && rect.height > 0;
+};
+const isGreenColour = colour => {
+    const rgb = (colour.match(/[\\d.]+/g) || []).map(Number);
+    if (rgb.length < 3 || rgb[3] === 0) return false;
+    const [r, g, b] = rgb.map(c => c / 255);
+    const max = Math.max(r, g, b), min = Math.min(r, g, b), delta = max - min;
+    if (max !== g || delta === 0) return false;
+    const hue = 60 * (((b - r) / delta) + 2);
+    return hue >= 70 && hue <= 170 && delta / max >= 50 / 255 && max >= 50 / 255;
+};
+// Background, gradient stops, text and icon fill all count
+const isGreen = el => {
+    const style = getComputedStyle(el);
+    const gradient = style.backgroundImage.match(/rgba?\\([^)]*\\)/g) || [];
+    return [style.backgroundColor, style.color, style.fill, ...gradient].some(isGreenColour);
+};
+for (const button of document.querySelectorAll('.btn-download')) {
+    if (!isVisible(button)) continue;
+    const green = [button, ...button.querySelectorAll('*')].some(isGreen);
+    const style = getComputedStyle(button);
+    return {button: button, green: green, colour: style.backgroundColor + ' ' + style.backgroundImage};
+}
+return null;
+"""
+
+# Screenshot scan for buttons the style check cannot judge, e.g. an image
+# background, or that are not a .btn-download at all. It only runs when no
+# green button was found in the DOM; turning it off skips such pages.
+USE_VISION_FALLBACK = True
+BUTTON_WAIT = 10
+
+def find_download_button(driver):
+    # The button may render after the page load; wait for it like the old
+    # visibility wait did, re-running the check until it finds one
+    try:
+        found = WebDriverWait(driver, BUTTON_WAIT).until(lambda d: d.execute_script(DOWNLOAD_BUTTON_JS))
+    except TimeoutException:
+        found = None
+    except Exception as e:
+        logging.error(f"Error checking download button: {str(e)}")
+        found = None
+    if found and found["green"]:
+        logging.info("Green download button found")
+        return found["button"]
+    if found:
+        logging.info(f"Download button found but not green, colour: {found['colour']}")
+    if USE_VISION_FALLBACK and is_green_button_present(driver):
+        if found:
+            return found["button"]
+        try:
+            return driver.find_element(By.CLASS_NAME, "btn-download")
+        except Exception:
+            return None
+    return None
 
 def is_green_button_present(driver, threshold=0.8):
     logging.info("Starting green button detection")
     try:
-        screenshot_path = "screenshot.png"
         max_scrolls = 5
         scroll_increment = 500
         total_height = driver.execute_script("return document.body.scrollHeight")
@@ -55,10 +254,9 @@ def is_green_button_present(driver, threshold=0.8):
             scroll_position = i * scroll_increment
             driver.execute_script(f"window.scrollTo(0, {scroll_position});")
             logging.debug(f"Scrolled to position: {scroll_position} ({i+1}/{max_scrolls})")
-            time.sleep(1)
-            driver.save_screenshot(screenshot_path)
-            logging.debug(f"Screenshot saved: {screenshot_path} at position {scroll_position}")
-            img = cv2.imread(screenshot_path)
+            # Decoded straight from memory; nothing shared on disk between workers
+            png = np.frombuffer(driver.get_screenshot_as_png(), dtype=np.uint8)
+            img = cv2.imdecode(png, cv2.IMREAD_COLOR)
             hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
             lower_green = np.array([35, 50, 50])
             upper_green = np.array([85, 255, 255])
@@ -77,41 +275,30 @@ def is_green_button_present(driver, threshold=0.8):
     except Exception as e:
         logging.error(f"Error detecting green button: {str(e)}")
         return False
-    finally:
-        if os.path.exists(screenshot_path):
-            os.remove(screenshot_path)
-            logging.debug("Screenshot file cleaned up")
 
-def check_existing_file(target_dir, output_filename):
-    target_path = os.path.join(target_dir, output_filename)
-    return os.path.exists(target_path)
+def article_id_from_link(detail_url):
+    return detail_url.split('filename=')[-1]
 
-def download_pdf(detail_url, target_dir="G:\\cnki"):
-    article_id = detail_url.split('filename=')[-1]
-    output_filename = f"{article_id}.pdf"
-    
-    if check_existing_file(target_dir, output_filename):
-        print(f"[{time.strftime('%H:%M:%S')}] File {output_filename} already exists, skipping")
-        logging.info(f"File {output_filename} already exists, skipping {detail_url}")
-        return True
+def article_id_from_file(name):
+    return name[:-4] if name.lower().endswith(".pdf") else None
 
-    temp_dir = tempfile.mkdtemp()
-
-    firefox_options = Options()
-    firefox_options.set_preference("browser.download.folderList", 2)
-    firefox_options.set_preference("browser.download.dir", temp_dir)
-    firefox_options.set_preference("browser.download.useDownloadDir", True)
-    firefox_options.set_preference("browser.helperApps.neverAsk.saveToDisk", "application/pdf")
-    firefox_options.set_preference("pdfjs.disabled", True)
-    firefox_options.binary_location = "C:\\Program Files\\Mozilla Firefox\\firefox.exe"
+def download_pdf(detail_url, pool, manifest, target_dir="G:\\cnki"):
+    article_id = article_id_from_link(detail_url)
+    output_filename = f"{article_id}.pdf"
 
     try:
-        driver = webdriver.Firefox(options=firefox_options)
+        with pool.session() as session:
+            return fetch_with_session(session, detail_url, target_dir, output_filename, manifest, article_id)
     except Exception as e:
-        print(f"[{time.strftime('%H:%M:%S')}] Failed to start Firefox: {str(e)}")
-        logging.error(f"Failed to start Firefox: {str(e)}")
+        print(f"[{time.strftime('%H:%M:%S')}] Firefox session error: {str(e)}")
+        logging.error(f"Firefox session error: {str(e)} for {detail_url}")
         return False
 
+def fetch_with_session(session, detail_url, target_dir, output_filename, manifest, article_id):
+    driver = session.driver
+    temp_dir = session.download_dir
+    watcher = shared_watcher()
+    download = None
     try:
         logging.info(f"Starting download: {detail_url}")
         print(f"[{time.strftime('%H:%M:%S')}] Starting download for {detail_url}")
@@ -123,15 +310,13 @@ def download_pdf(detail_url, target_dir="G:\\cnki"):
             logging.info(f"Resource not found for {detail_url}, skipping")
             return False
 
-        if not is_green_button_present(driver):
+        download_button = find_download_button(driver)
+        if download_button is None:
             print(f"[{time.strftime('%H:%M:%S')}] Failed to detect green button, skipping")
             logging.warning(f"Failed to detect green button for {detail_url}")
             return False
 
         try:
-            download_button = WebDriverWait(driver, 10).until(
-                EC.visibility_of_element_located((By.CLASS_NAME, "btn-download"))
-            )
             print(f"[{time.strftime('%H:%M:%S')}] Detected download button")
             logging.info(f"Detected download button for {detail_url}")
             ActionChains(driver).move_to_element(download_button).perform()
@@ -141,76 +326,51 @@ def download_pdf(detail_url, target_dir="G:\\cnki"):
         except Exception as e:
             print(f"[{time.strftime('%H:%M:%S')}] Failed to hover over download button: {str(e)}")
             logging.error(f"Failed to hover over download button: {str(e)} for {detail_url}")
-            driver.save_screenshot("hover_error.png")
+            session.error_screenshot = driver.get_screenshot_as_png()
             return False
 
         try:
             pdf_option = WebDriverWait(driver, 10).until(
                 EC.element_to_be_clickable((By.ID, "pdfDown"))
             )
+            download = watcher.watch(temp_dir)
             pdf_option.click()
             print(f"[{time.strftime('%H:%M:%S')}] Clicked PDF download button")
             logging.info(f"Clicked PDF download button for {detail_url}")
         except Exception as e:
             print(f"[{time.strftime('%H:%M:%S')}] Failed to click PDF download: {str(e)}")
             logging.error(f"Failed to click PDF download: {str(e)} for {detail_url}")
-            driver.save_screenshot("click_error.png")
+            session.error_screenshot = driver.get_screenshot_as_png()
             return False
 
-        timeout = 60
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            files = [f for f in os.listdir(temp_dir) if f.endswith(('.pdf', '.pdf.part'))]
-            if files:
-                filepath = os.path.join(temp_dir, files[0])
-                try:
-                    size1 = os.path.getsize(filepath)
-                    time.sleep(0.5)
-                    size2 = os.path.getsize(filepath)
-                    if size1 == size2 and size1 > 0:
-                        final_filepath = filepath
-                        if filepath.endswith('.pdf.part'):
-                            final_filepath = filepath.replace('.pdf.part', '.pdf')
-                            extra_wait = 5
-                            wait_start = time.time()
-                            while time.time() - wait_start < extra_wait:
-                                if os.path.exists(final_filepath) and os.path.getsize(final_filepath) > 0:
-                                    filepath = final_filepath
-                                    break
-                                time.sleep(0.5)
-                            else:
-                                print(f"[{time.strftime('%H:%M:%S')}] .pdf.part did not convert to .pdf, timeout")
-                                logging.warning(f".pdf.part did not convert to .pdf, timeout for {detail_url}")
-                                return False
-                        if verify_pdf(filepath):
-                            target_path = os.path.join(target_dir, output_filename)
-                            shutil.move(filepath, target_path)
-                            print(f"[{time.strftime('%H:%M:%S')}] File moved to: {target_path}")
-                            logging.info(f"File moved to: {target_path}")
-                            return True
-                        else:
-                            return False
-                except OSError as e:
-                    print(f"[{time.strftime('%H:%M:%S')}] Error accessing file: {str(e)}")
-                    logging.error(f"Error accessing file: {str(e)} for {detail_url}")
-                    time.sleep(0.5)
-                    continue
-            time.sleep(0.5)
-        print(f"[{time.strftime('%H:%M:%S')}] Download timed out")
-        logging.warning(f"Download timed out for {detail_url}")
-        return False
+        try:
+            result = download.result(timeout=DOWNLOAD_TIMEOUT)
+        except FutureTimeoutError:
+            print(f"[{time.strftime('%H:%M:%S')}] Download timed out")
+            logging.warning(f"Download timed out for {detail_url}")
+            # A download still running would leak into the next job
+            session.failed = True
+            return False
+        logging.info(f"Downloaded {detail_url}: {format_download(result)}")
+
+        if not verify_pdf(result["path"]):
+            return False
+        size, sha256 = file_digest(result["path"])
+        target_path = os.path.join(target_dir, output_filename)
+        shutil.move(result["path"], target_path)
+        manifest.add(article_id, output_filename, size, sha256)
+        print(f"[{time.strftime('%H:%M:%S')}] File moved to: {target_path}")
+        logging.info(f"File moved to: {target_path}")
+        return True
 
     except Exception as e:
         print(f"[{time.strftime('%H:%M:%S')}] Error: {str(e)}")
         logging.error(f"Error: {str(e)} for {detail_url}")
+        session.failed = True
         return False
     finally:
-        driver.quit()
-        shutil.rmtree(temp_dir, ignore_errors=True)
-        if os.path.exists("hover_error.png"):
-            os.remove("hover_error.png")
-        if os.path.exists("click_error.png"):
-            os.remove("click_error.png")
+        if download is not None:
+            watcher.unwatch(download)
 
 def main():
     excel_path = ""
@@ -231,12 +391,24 @@ def main():
         os.makedirs(target_dir)
         logging.info(f"Created target directory: {target_dir}")
 
-    print(f"Found {len(links)} links, starting download...")
-    logging.info(f"Found {len(links)} links, starting download")
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = [executor.submit(download_pdf, link, target_dir) for link in links]
-        for future in tqdm(as_completed(futures), total=len(links), desc="Download progress", unit="file"):
-            pass
+    manifest = DownloadManifest("cnki")
+    manifest.seed_from_directory(target_dir, article_id_from_file)
+    pending = manifest.missing(links, key=article_id_from_link)
+    print(f"Found {len(links)} links, {len(links) - len(pending)} already downloaded, starting download...")
+    logging.info(f"Found {len(links)} links, {len(links) - len(pending)} already downloaded, starting download")
+    pool = DriverPool()
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = [executor.submit(download_pdf, link, pool, manifest, target_dir) for link in pending]
+            for future in tqdm(as_completed(futures), total=len(pending), desc="Download progress", unit="file"):
+                pass
+    finally:
+        pool.close()
+        pdf_validator.close()
+        manifest.close()
+    print(pool.report())
+    logging.info(pool.report())
+    logging.info(pdf_validator.report())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,73 @@
+import time
+import logging
+from sqlite_store import SqliteStore
+
+CHECKPOINT_PATH = "cnki_checkpoint.sqlite3"
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS pages ("
+    "keyword TEXT NOT NULL, query TEXT NOT NULL, page INTEGER NOT NULL, finished_at REAL, "
+    "PRIMARY KEY (keyword, query, page))",
+    "CREATE TABLE IF NOT EXISTS queries ("
+    "keyword TEXT NOT NULL, query TEXT NOT NULL, finished_at REAL, "
+    "PRIMARY KEY (keyword, query))",
+    "CREATE TABLE IF NOT EXISTS seen ("
+    "title TEXT NOT NULL, link TEXT NOT NULL, keyword TEXT, "
+    "PRIMARY KEY (title, link))",
+)
+
+
+class CrawlCheckpoint(SqliteStore):
+    # Progress of a CNKI sweep: finished (keyword, query, page) tuples and the
+    # dedup keys saved so far. A page and its new keys are committed together,
+    # after its articles have been flushed to the result store.
+
+    def __init__(self, path=CHECKPOINT_PATH):
+        super().__init__(path, SCHEMA)
+
+    def seen_keys(self):
+        with self._lock:
+            return {(title, link) for title, link in self._conn.execute("SELECT title, link FROM seen")}
+
+    def keyword_counts(self):
+        with self._lock:
+            return dict(self._conn.execute("SELECT keyword, COUNT(*) FROM seen GROUP BY keyword"))
+
+    def start_page(self, keyword, query):
+        # First unfinished page, or None if the whole query is done
+        with self._lock:
+            if self._conn.execute(
+                "SELECT 1 FROM queries WHERE keyword = ? AND query = ?", (keyword, query)
+            ).fetchone():
+                return None
+            finished = {row[0] for row in self._conn.execute(
+                "SELECT page FROM pages WHERE keyword = ? AND query = ?", (keyword, query)
+            )}
+        page = 1
+        while page in finished:
+            page += 1
+        return page
+
+    def complete_page(self, keyword, query, page, new_keys):
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO seen VALUES (?, ?, ?)",
+                    [(title, link, keyword) for title, link in new_keys]
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)",
+                    (keyword, query, page, time.time())
+                )
+
+    def finish_query(self, keyword, query):
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO queries VALUES (?, ?, ?)",
+                    (keyword, query, time.time())
+                )
+
+    def close(self):
+        super().close()
+        logging.info("Checkpoint closed")
@@ -0,0 +1,72 @@
+import time
+import logging
+from sqlite_store import SqliteStore
+
+CACHE_PATH = "doi_cache.sqlite3"
+CACHE_TTL = 30 * 24 * 3600
+NEGATIVE_TTL = 3 * 24 * 3600
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS doi_cache ("
+    "doi TEXT PRIMARY KEY, pdf_url TEXT, status INTEGER, "
+    "content_type TEXT, size INTEGER, fetched_at REAL, resolver TEXT)",
+)
+
+
+class DoiCache(SqliteStore):
+    # DOI -> resolved PDF URL, shared by pubmed.py and pubmed2_pdflink.py.
+    # Entries without a pdf_url are negative results and expire after negative_ttl.
+    # resolver records which tool produced an entry ("browser" or "static"),
+    # since a static parse failing says little about what a browser can reach.
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, negative_ttl=NEGATIVE_TTL):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stats = {"hits": 0, "misses": 0, "expired": 0}
+        super().__init__(path, SCHEMA)
+        # Caches created before entries were tagged with their resolver
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(doi_cache)")}
+        if "resolver" not in columns:
+            self._conn.execute("ALTER TABLE doi_cache ADD COLUMN resolver TEXT")
+        self._conn.commit()
+
+    def get(self, doi):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT pdf_url, status, content_type, size, fetched_at, resolver FROM doi_cache WHERE doi = ?",
+                (doi,)
+            ).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            pdf_url, status, content_type, size, fetched_at, resolver = row
+            ttl = self.ttl if pdf_url else self.negative_ttl
+            if time.time() - fetched_at > ttl:
+                self.stats["expired"] += 1
+                return None
+            self.stats["hits"] += 1
+        return {
+            "pdf_url": pdf_url,
+            "status": status,
+            "content_type": content_type,
+            "size": size,
+            "fetched_at": fetched_at,
+            "resolver": resolver,
+        }
+
+    def put(self, doi, pdf_url, status=None, content_type=None, size=None, resolver=None):
+        try:
+            size = int(size) if size is not None else None
+        except (TypeError, ValueError):
+            size = None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO doi_cache "
+                "(doi, pdf_url, status, content_type, size, fetched_at, resolver) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (doi, pdf_url, status, content_type, size, time.time(), resolver)
+            )
+            self._conn.commit()
+
+    def close(self):
+        super().close()
+        logging.info(f"DOI cache stats: {self.stats}")
@@ -0,0 +1,79 @@
+import hashlib
+import os
+import time
+import logging
+from sqlite_store import SqliteStore
+
+MANIFEST_PATH = "download_manifest.sqlite3"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS downloads ("
+    "source TEXT NOT NULL, id TEXT NOT NULL, file TEXT, size INTEGER, "
+    "sha256 TEXT, saved_at REAL, PRIMARY KEY (source, id))",
+)
+
+
+def file_digest(path):
+    # Size and sha256 of a finished download; hash the local temp copy before
+    # it is moved so the output share is not read back
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return os.path.getsize(path), sha256.hexdigest()
+
+
+class DownloadManifest(SqliteStore):
+    # IDs already saved by one downloader (source), loaded once into a set so
+    # the input can be filtered without touching the output directory.
+    # Each success is committed on its own.
+
+    def __init__(self, source, path=MANIFEST_PATH):
+        self.source = source
+        super().__init__(path, SCHEMA)
+        self._ids = {
+            row[0] for row in self._conn.execute("SELECT id FROM downloads WHERE source = ?", (source,))
+        }
+
+    def __contains__(self, id):
+        return str(id) in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def missing(self, items, key=lambda item: item):
+        return [item for item in items if str(key(item)) not in self._ids]
+
+    def add(self, id, file, size=None, sha256=None):
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO downloads VALUES (?, ?, ?, ?, ?, ?)",
+                    (self.source, str(id), file, size, sha256, time.time())
+                )
+            self._ids.add(str(id))
+
+    def seed_from_directory(self, directory, id_from_name):
+        # One-off import of files saved before the manifest existed; they get
+        # no hash, since reading them all back is what the manifest avoids
+        if self._ids or not os.path.isdir(directory):
+            return 0
+        rows = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                id = id_from_name(entry.name) if entry.is_file() else None
+                if id:
+                    rows.append((self.source, str(id), entry.name, entry.stat().st_size, None, time.time()))
+        with self._lock:
+            with self._conn:
+                self._conn.executemany("INSERT OR IGNORE INTO downloads VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._ids.update(row[1] for row in rows)
+        logging.info(f"Seeded {self.source} manifest with {len(rows)} files from {directory}")
+        return len(rows)
+
+    def files(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT file FROM downloads WHERE source = ? ORDER BY saved_at", (self.source,)
+            )]
@@ -0,0 +1,219 @@
+import os
+import threading
+import time
+import logging
+from concurrent.futures import Future, InvalidStateError
+
+try:
+    # inotify on Linux, ReadDirectoryChangesW on Windows
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+TEMP_SUFFIXES = (".part", ".crdownload", ".tmp")
+# A finished file must keep its size this long before it is handed over
+STABLE_TIME = 1.0
+POLL_INTERVAL = 0.5
+
+
+def is_temp(name):
+    return name.lower().endswith(TEMP_SUFFIXES)
+
+
+class _Watch:
+    def __init__(self, directory, suffixes):
+        self.directory = directory
+        self.suffixes = suffixes
+        self.future = Future()
+        self.started = time.monotonic()
+        self.first_byte = None
+        self.finished = None
+        self.last_size = None
+        self.dirty = True
+        self.handle = None
+
+
+class _EventHandler(FileSystemEventHandler):
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if not event.is_directory:
+            self.watcher._on_event(event)
+
+
+class DownloadWatcher:
+    # One background thread watching every worker's download directory. watch()
+    # returns a Future that resolves once no temp file is left and the final
+    # file has stopped growing; the result carries size, time-to-first-byte
+    # and transfer rate. Without watchdog the directories are polled instead.
+
+    def __init__(self, stable_time=STABLE_TIME, poll_interval=POLL_INTERVAL, use_events=True):
+        self.stable_time = stable_time
+        self.poll_interval = poll_interval
+        self._watches = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._observer = None
+        if use_events and Observer is not None:
+            self._observer = Observer()
+            self._observer.start()
+        else:
+            logging.info("watchdog not available, polling download directories")
+        self._thread = threading.Thread(target=self._run, name="download-watcher", daemon=True)
+        self._thread.start()
+
+    def watch(self, directory, suffixes=(".pdf",)):
+        # Call before triggering the download so time-to-first-byte is measured from the click
+        directory = os.path.abspath(directory)
+        watch = _Watch(directory, suffixes)
+        with self._lock:
+            previous = self._watches.pop(directory, None)
+            self._watches[directory] = watch
+        if previous is not None:
+            self._release(previous)
+        if self._observer is not None:
+            watch.handle = self._observer.schedule(_EventHandler(self), directory, recursive=False)
+        return watch.future
+
+    def unwatch(self, future):
+        with self._lock:
+            for directory, watch in list(self._watches.items()):
+                if watch.future is future:
+                    del self._watches[directory]
+                    break
+            else:
+                return
+        self._release(watch)
+
+    def _release(self, watch):
+        watch.future.cancel()
+        if watch.handle is not None:
+            try:
+                self._observer.unschedule(watch.handle)
+            except Exception as e:
+                logging.debug(f"Error unscheduling {watch.directory}: {e}")
+
+    def _on_event(self, event):
+        paths = [event.src_path, getattr(event, "dest_path", None)]
+        now = time.monotonic()
+        with self._lock:
+            for path in paths:
+                watch = self._watches.get(os.path.dirname(os.path.abspath(path))) if path else None
+                if watch is None:
+                    continue
+                watch.dirty = True
+                # Bytes are being written once a file in the directory is modified
+                if watch.first_byte is None and event.event_type == "modified":
+                    watch.first_byte = now
+
+    def _check(self, watch, now):
+        try:
+            names = os.listdir(watch.directory)
+        except OSError as e:
+            self._resolve(watch, exception=e)
+            return True
+        finals = [
+            n for n in names
+            if not is_temp(n) and (watch.suffixes is None or n.lower().endswith(watch.suffixes))
+        ]
+        sizes = {}
+        for name in names:
+            try:
+                sizes[name] = os.path.getsize(os.path.join(watch.directory, name))
+            except OSError:
+                pass
+        if watch.first_byte is None and any(sizes.values()):
+            watch.first_byte = now
+        if any(is_temp(n) for n in names) or not finals:
+            watch.finished = None
+            watch.last_size = None
+            return False
+
+        path = os.path.join(watch.directory, finals[0])
+        size = sizes.get(finals[0], 0)
+        if size == 0:
+            return False
+        if size != watch.last_size:
+            watch.last_size = size
+            watch.finished = now
+            return False
+        if now - watch.finished < self.stable_time:
+            return False
+
+        first_byte = watch.first_byte or watch.started
+        transfer_time = max(watch.finished - first_byte, 1e-6)
+        self._resolve(watch, result={
+            "path": path,
+            "size": size,
+            "ttfb": first_byte - watch.started,
+            "elapsed": watch.finished - watch.started,
+            "rate": size / transfer_time,
+        })
+        return True
+
+    def _resolve(self, watch, result=None, exception=None):
+        # A worker may cancel the future (unwatch) while a check is in flight
+        try:
+            if exception is not None:
+                watch.future.set_exception(exception)
+            else:
+                watch.future.set_result(result)
+        except InvalidStateError:
+            pass
+
+    def _run(self):
+        while not self._closed.wait(self.poll_interval):
+            now = time.monotonic()
+            with self._lock:
+                watches = list(self._watches.items())
+            for directory, watch in watches:
+                # With events, idle directories are skipped until something changes
+                if self._observer is not None and not watch.dirty and watch.finished is None:
+                    continue
+                watch.dirty = False
+                try:
+                    finished = watch.future.done() or self._check(watch, now)
+                except Exception as e:
+                    # One bad directory must never stop the thread serving every worker
+                    logging.error(f"Error checking downloads in {directory}: {e}")
+                    self._resolve(watch, exception=e)
+                    finished = True
+                if finished:
+                    with self._lock:
+                        if self._watches.get(directory) is watch:
+                            del self._watches[directory]
+                    self._release(watch)
+
+    def close(self):
+        self._closed.set()
+        self._thread.join()
+        with self._lock:
+            watches = list(self._watches.values())
+            self._watches.clear()
+        for watch in watches:
+            self._release(watch)
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+
+
+def format_download(result):
+    return (
+        f"{result['size'] / 1024:.1f} KB in {result['elapsed']:.1f}s, "
+        f"first byte after {result['ttfb']:.1f}s, {result['rate'] / 1024:.1f} KB/s"
+    )
+
+
+_shared_watcher = None
+_shared_lock = threading.Lock()
+
+
+def shared_watcher():
+    global _shared_watcher
+    with _shared_lock:
+        if _shared_watcher is None:
+            _shared_watcher = DownloadWatcher()
+        return _shared_watcher
@@ -0,0 +1,111 @@
+import mmap
+import os
+import re
+import threading
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+# Readers accept the header anywhere in the first KB and the trailer in the last KB
+HEADER_WINDOW = 1024
+TRAILER_WINDOW = 1024
+DEEP_WORKERS = 2
+
+# Only these fast-path results reject a file outright. A bad startxref offset
+# is common and recoverable (PyPDF2 strict=False rebuilds the xref), so it
+# only means the file needs the deep check.
+HARD_FAILURES = ("bad_header", "truncated")
+
+STARTXREF_RE = re.compile(rb"startxref\s+(\d+)")
+XREF_TARGET_RE = re.compile(rb"\s*(xref|\d+\s+\d+\s+obj)")
+
+
+def fast_check(path):
+    # Header, %%EOF trailer and the startxref offset, read through mmap so only
+    # the touched pages are loaded. Returns ok, bad_header, truncated or bad_xref.
+    size = os.path.getsize(path)
+    if size == 0:
+        return "bad_header"
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        header = mm.find(b"%PDF-", 0, HEADER_WINDOW)
+        if header == -1:
+            return "bad_header"
+        tail = max(0, size - TRAILER_WINDOW)
+        eof = mm.rfind(b"%%EOF", tail)
+        if eof == -1:
+            return "truncated"
+        match = STARTXREF_RE.search(mm[tail:eof])
+        if not match:
+            return "bad_xref"
+        offset = int(match.group(1))
+        # Offsets count from the header when junk precedes it
+        for start in {offset, offset + header}:
+            if start < size and XREF_TARGET_RE.match(mm[start:start + 64]):
+                return "ok"
+    return "bad_xref"
+
+
+def deep_check(path):
+    # Full xref and page-tree parse; runs in a worker process
+    from PyPDF2 import PdfReader
+    try:
+        pages = len(PdfReader(path, strict=False).pages)
+    except Exception as e:
+        return "unreadable", str(e)
+    if pages == 0:
+        return "unreadable", "no pages"
+    return "ok", pages
+
+
+class PdfValidator:
+    def __init__(self, deep=False, workers=DEEP_WORKERS):
+        self.deep = deep
+        self.workers = workers
+        self._pool = None
+        self._lock = threading.Lock()
+        self.stats = {"fast": [0, 0.0], "deep": [0, 0.0]}
+
+    def _record(self, tier, start):
+        with self._lock:
+            self.stats[tier][0] += 1
+            self.stats[tier][1] += time.perf_counter() - start
+
+    def _deep_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def validate(self, path):
+        start = time.perf_counter()
+        try:
+            state = fast_check(path)
+        except (OSError, ValueError) as e:
+            logging.error(f"Error checking PDF {path}: {e}")
+            state = "unreadable"
+        self._record("fast", start)
+        if state == "bad_xref" and not self.deep:
+            logging.warning(f"PDF has a bad startxref offset, accepting without deep check: {path}")
+            return "ok"
+        if state not in ("ok", "bad_xref") or not self.deep:
+            return state
+
+        start = time.perf_counter()
+        state, detail = self._deep_pool().submit(deep_check, path).result()
+        self._record("deep", start)
+        if state == "ok":
+            logging.info(f"PDF verified, pages: {detail} for {path}")
+        else:
+            logging.error(f"PDF failed deep check: {detail} for {path}")
+        return state
+
+    def report(self):
+        parts = []
+        for tier, (count, seconds) in self.stats.items():
+            if count:
+                parts.append(f"{tier}: {count} files, {seconds * 1000 / count:.2f} ms avg")
+        return "PDF validation " + (", ".join(parts) if parts else "not run")
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
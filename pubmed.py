@@ -8,14 +8,22 @@ import logging
 import nest_asyncio
 import signal
 import sys
+import argparse
 from concurrent.futures import ThreadPoolExecutor
-from PyPDF2 import PdfReader
+from pdf_validator import fast_check, HARD_FAILURES
+from download_manifest import DownloadManifest, file_digest
 import shutil
 import hashlib
 import random
 import aiofiles
 import contextlib
 import tempfile
+import json
+import re
+from urllib.parse import urlparse
+from resource_blocking import ResourceBlocker, format_stats
+from doi_cache import DoiCache
+from result_store import ResultStore
 from shutil import disk_usage
 
 nest_asyncio.apply()
@@ -25,6 +33,7 @@ TEMP_BASE_DIR = r""
 EXCEL_PATH = r""
 FAILED_EXCEL_PATH = r""
 REMAINING_EXCEL_PATH = r""
+JOURNAL_PATH = "download_journal.jsonl"
 LOG_FILE = "download_log.txt"
 
 MAX_CONCURRENT_TASKS = 5
@@ -34,8 +43,22 @@ RETRY_DELAY_MAX = 8
 SAVE_INTERVAL = 5
 MIN_FILE_SIZE = 1000
 PAGE_TIMEOUT = 60000
-DOWNLOAD_WAIT_TIME = 20
+DOWNLOAD_START_TIMEOUT = 10
+DOWNLOAD_STALL_TIMEOUT = 15
+DOWNLOAD_MAX_TIME = 300
 MIN_DISK_SPACE_GB = 1
+BROWSER_POOL_SIZE = MAX_CONCURRENT_TASKS
+BROWSER_MAX_PAGES = 50
+SELECTOR_TIMEOUT = 20000
+
+DOWNLOAD_SELECTORS = [
+    "div#buttons button:nth-child(2)",
+    "button.download",
+    "button.save-btn",
+    "a.download-button",
+    "a[download]",
+    "button[download]"
+]
 
 logging.basicConfig(
     level=logging.DEBUG,
@@ -46,9 +69,12 @@ logging.basicConfig(
     ]
 )
 
-failed_records = []
-remaining_records = []
+failed_records = {}
+remaining_records = {}
 processed_count = 0
+journal_file = None
+selector_by_domain = {}
+resource_blocker = ResourceBlocker()
 lock = asyncio.Lock()
 
 try:
@@ -62,14 +88,33 @@ except Exception as e:
     logging.error(f"Failed to read Excel file: {e}")
     sys.exit(1)
 
+def has_pmid(pmid):
+    # astype(str) turns an empty PMID cell into "nan"
+    return isinstance(pmid, str) and pmid.strip() not in ("", "nan", "Unknown_PMID")
+
+def record_id(doi, pmid):
+    # Store rows are keyed by PMID; a DOI without one falls back to the DOI
+    # so those records do not all overwrite one "Unknown_PMID" row
+    return pmid if has_pmid(pmid) else doi
+
+def pdf_name(doi, pmid):
+    if has_pmid(pmid):
+        return f"PMID_{pmid}.pdf"
+    return "DOI_" + re.sub(r'[\\/:*?"<>|]', "_", doi) + ".pdf"
+
 def signal_handler(sig, frame):
     logging.info("Interrupt signal received, saving current state...")
-    save_to_excel(failed_records, FAILED_EXCEL_PATH)
-    save_to_excel(remaining_records, REMAINING_EXCEL_PATH)
+    save_state()
     logging.info("State saved, program exiting")
     sys.exit(0)
 
+def export_signal_handler(sig, frame):
+    logging.info("Export signal received, writing Excel snapshots...")
+    save_state()
+
 signal.signal(signal.SIGINT, signal_handler)
+if hasattr(signal, "SIGUSR1"):
+    signal.signal(signal.SIGUSR1, export_signal_handler)
 
 def save_to_excel(records, file_path):
     if records:
@@ -80,49 +125,248 @@ def save_to_excel(records, file_path):
         except Exception as e:
             logging.error(f"Failed to save Excel file {file_path}: {e}")
 
-@contextlib.asynccontextmanager
-async def browser_context():
-    browser = None
+def save_state():
+    save_to_excel(list(failed_records.values()), FAILED_EXCEL_PATH)
+    save_to_excel(list(remaining_records.values()), REMAINING_EXCEL_PATH)
+
+def load_journal(path):
+    outcomes = {}
+    if not os.path.exists(path):
+        return outcomes
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash mid-write can leave a torn last line
+                continue
+            outcomes[entry["DOI"]] = entry
+    return outcomes
+
+def load_progress(manifest):
+    # Failed and remaining records rebuilt from the journal and the input
+    # sheet; PDFs saved by any earlier run are skipped, journal or not
+    all_dois = df[df["DOI"].notna() & (df["DOI"].astype(str).str.strip() != "DOI 未找到")]["DOI"].drop_duplicates().tolist()
+    outcomes = load_journal(JOURNAL_PATH)
+    failed = {
+        doi: {"DOI": doi, "PMID": entry["PMID"]}
+        for doi, entry in outcomes.items() if entry["status"] == "failed"
+    }
+    doi_by_file = {pdf_name(doi, pmid): doi for doi, pmid in doi_pmid_map.items()}
+    manifest.seed_from_directory(DOWNLOAD_DIR, doi_by_file.get)
+    remaining = {
+        doi: {"DOI": doi, "PMID": doi_pmid_map.get(doi, "Unknown_PMID")}
+        for doi in all_dois if doi not in outcomes and doi not in manifest
+    }
+    return outcomes, failed, remaining
+
+def export_progress():
+    # The on-demand export without a running crawl; SIGUSR1 does not exist on Windows
+    global failed_records, remaining_records
+    manifest = DownloadManifest("pubmed")
     try:
-        browser = await launch(
-            headless=True,
-            executablePath=r"C:\Program Files\Google\Chrome\Application\chrome.exe",
-            args=['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage'],
-            handleSIGINT=False,
-            handleSIGTERM=False
-        )
-        if browser is None:
-            raise ValueError("Browser launch failed, returned None")
-        logging.debug("Browser launched successfully.")
-        yield browser
-    except Exception as e:
-        logging.error(f"Browser launch failed: {e}")
-        raise
+        _, failed_records, remaining_records = load_progress(manifest)
     finally:
+        manifest.close()
+    save_state()
+    logging.info(f"Exported {len(failed_records)} failed and {len(remaining_records)} remaining DOIs from {JOURNAL_PATH}")
+
+def append_journal(entry):
+    journal_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    journal_file.flush()
+
+async def launch_browser():
+    browser = await launch(
+        headless=True,
+        executablePath=r"C:\Program Files\Google\Chrome\Application\chrome.exe",
+        args=['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage'],
+        handleSIGINT=False,
+        handleSIGTERM=False
+    )
+    if browser is None:
+        raise ValueError("Browser launch failed, returned None")
+    logging.debug("Browser launched successfully.")
+    return browser
+
+async def close_browser(browser):
+    try:
+        await browser.close()
+        logging.info("Browser closed successfully")
+    except Exception as CLOSE_ERROR:
+        logging.error(f"Error closing browser:{CLOSE_ERROR}")
+
+# Long-lived browsers handing out one incognito page per DOI; a browser is
+# recycled after max_pages pages or as soon as it (or one of its pages) crashes.
+class BrowserPool:
+    def __init__(self, size=BROWSER_POOL_SIZE, max_pages=BROWSER_MAX_PAGES):
+        self.size = size
+        self.max_pages = max_pages
+        self.stats = {"launches": 0, "reuses": 0, "recycles": 0}
+        self._slots = asyncio.Queue()
+        for _ in range(size):
+            self._slots.put_nowait({"browser": None, "pages": 0, "crashed": False})
+
+    def _mark_crashed(self, slot, browser):
+        if slot["browser"] is browser:
+            slot["crashed"] = True
+
+    async def _recycle(self, slot):
+        browser = slot["browser"]
+        slot["browser"] = None
+        slot["pages"] = 0
+        slot["crashed"] = False
         if browser:
+            self.stats["recycles"] += 1
+            await close_browser(browser)
+
+    @contextlib.asynccontextmanager
+    async def page(self):
+        slot = await self._slots.get()
+        context = None
+        try:
+            if slot["browser"] is None:
+                browser = await launch_browser()
+                browser.on('disconnected', lambda: self._mark_crashed(slot, browser))
+                slot["browser"] = browser
+                self.stats["launches"] += 1
+            else:
+                browser = slot["browser"]
+                self.stats["reuses"] += 1
+            try:
+                context = await browser.createIncognitoBrowserContext()
+                page = await context.newPage()
+            except Exception:
+                slot["crashed"] = True
+                raise
+            page.on('error', lambda _: self._mark_crashed(slot, browser))
+            yield page
+        finally:
+            if context is not None:
+                try:
+                    await context.close()
+                except Exception as e:
+                    logging.warning(f"Error closing browser context: {e}")
+                    slot["crashed"] = True
+            slot["pages"] += 1
+            if slot["crashed"] or slot["pages"] >= self.max_pages:
+                await self._recycle(slot)
+            self._slots.put_nowait(slot)
+
+    async def close(self):
+        while not self._slots.empty():
+            slot = self._slots.get_nowait()
+            if slot["browser"]:
+                await close_browser(slot["browser"])
+                slot["browser"] = None
+        logging.info(f"Browser pool stats: {self.stats}")
+
+# Tracks the DevTools download events of one page so completion follows the
+# transfer instead of a fixed sleep: fail fast if nothing starts, and keep
+# waiting only while bytes keep arriving.
+class DownloadWatcher:
+    def __init__(self, page):
+        self.started = asyncio.Event()
+        self.finished = asyncio.Event()
+        self.state = None
+        self.url = None
+        self.received_bytes = 0
+        self.total_bytes = 0
+        self.last_progress = time.monotonic()
+        page._client.on('Page.downloadWillBegin', self._on_begin)
+        page._client.on('Page.downloadProgress', self._on_progress)
+
+    def _on_begin(self, event):
+        self.url = event.get('url')
+        self.state = "inProgress"
+        self.last_progress = time.monotonic()
+        self.started.set()
+
+    def _on_progress(self, event):
+        self.started.set()
+        received = event.get('receivedBytes', 0)
+        if received > self.received_bytes:
+            self.received_bytes = received
+            self.last_progress = time.monotonic()
+        self.total_bytes = event.get('totalBytes', 0) or self.total_bytes
+        self.state = event.get('state', self.state)
+        if self.state in ("completed", "canceled"):
+            self.finished.set()
+
+    async def wait(self):
+        try:
+            await asyncio.wait_for(self.started.wait(), DOWNLOAD_START_TIMEOUT)
+        except asyncio.TimeoutError:
+            return "notStarted"
+        deadline = time.monotonic() + DOWNLOAD_MAX_TIME
+        while not self.finished.is_set():
+            if time.monotonic() >= deadline:
+                return "timeout"
+            if time.monotonic() - self.last_progress >= DOWNLOAD_STALL_TIMEOUT:
+                return "stalled"
             try:
-                await browser.close()
-                logging.info("Browser closed successfully")
-            except Exception as CLOSE_ERROR:
-                logging.error(f"Error closing browser:{CLOSE_ERROR}")
+                await asyncio.wait_for(self.finished.wait(), 1)
+            except asyncio.TimeoutError:
+                pass
+        return self.state
 
-async def download_and_rename_pdf(doi, pbar=None):
+async def find_download_button(page, doi):
+    domain = urlparse(page.url).netloc
+    preferred = selector_by_domain.get(domain)
+    if preferred:
+        button = await page.querySelector(preferred)
+        if button:
+            logging.info(f"[DOI: {doi}] Found download button: {preferred} (cached for {domain})")
+            return button
+
+    # Race every selector against one shared deadline; first match wins
+    waiters = {
+        asyncio.ensure_future(page.waitForSelector(selector, {"timeout": SELECTOR_TIMEOUT})): selector
+        for selector in DOWNLOAD_SELECTORS
+    }
+    pending = set(waiters)
+    deadline = time.monotonic() + SELECTOR_TIMEOUT / 1000
+    try:
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for waiter in done:
+                if waiter.exception() is None and waiter.result():
+                    selector = waiters[waiter]
+                    selector_by_domain[domain] = selector
+                    logging.info(f"[DOI: {doi}] Found download button: {selector}")
+                    return waiter.result()
+    finally:
+        for waiter in pending:
+            waiter.cancel()
+        # Collect the cancelled waiters so their timeouts are not reported as unhandled
+        await asyncio.gather(*pending, return_exceptions=True)
+    return None
+
+async def download_and_rename_pdf(doi, pool, cache, store, manifest, pbar=None):
     global failed_records, remaining_records, processed_count
     logging.info(f"Starting to process DOI: {doi}")
     success = False
     retries = 0
     pmid = doi_pmid_map.get(doi, "Unknown_PMID")
-    if not isinstance(pmid, str) or pmid.strip() == "":
+    if not has_pmid(pmid):
         pmid = "Unknown_PMID"
+    cached = cache.get(doi)
+    if cached and cached["resolver"] != "browser" and not urlparse(cached["pdf_url"] or "").scheme:
+        # Negatives and relative links from the static resolver say nothing
+        # about what a browser can download
+        cached = None
+    if cached and not cached["pdf_url"]:
+        logging.info(f"[DOI: {doi}] Cached as having no PDF, skipping")
+        retries = MAX_RETRIES
+    landing_status = None
+    no_pdf_found = False
 
     with tempfile.TemporaryDirectory(dir=TEMP_BASE_DIR) as temp_dir:
         while not success and retries < MAX_RETRIES:
             try:
-                async with browser_context() as browser:
-                    if browser is None:
-                        logging.error(f"[DOI: {doi}] Browser instance is None")
-                        raise ValueError("Browser instance not properly initialized")
-                    page = await browser.newPage()
+                async with pool.page() as page:
                     if page is None:
                         logging.error(f"[DOI: {doi}] Page creation failed, returned None")
                         raise ValueError("Page creation failed")
@@ -131,110 +375,144 @@ async def download_and_rename_pdf(doi, pbar=None):
                         'behavior': 'allow',
                         'downloadPath': temp_dir
                     })
-                    url = f"
-                    logging.debug(f"Navigating to: {url}")
-                    response = await page.goto(url, {"waitUntil": "networkidle2"})
-                    if response is None or not response.ok:
-                        logging.error(f"[DOI: {doi}] Page load failed, status: {response.status if response else 'None'}")
-                        raise ValueError("Page load failed")
-                    logging.info(f"[DOI: {doi}] Page loaded successfully: {url}")
-
-                    selectors = [
-                        "div#buttons button:nth-child(2)",
-                        "button.download",
-                        "button.save-btn",
-                        "a.download-button",
-                        "a[download]",
-                        "button[download]"
-                    ]
-                    download_button = None
-                    for selector in selectors:
+                    watcher = DownloadWatcher(page)
+                    blocking_stats = await resource_blocker.attach(page)
+                    if cached and retries == 0:
+                        logging.debug(f"Navigating to cached PDF URL: {cached['pdf_url']}")
                         try:
-                            download_button = await page.waitForSelector(selector, {"timeout": 20000})
-                            if download_button:
-                                logging.info(f"[DOI: {doi}] Found download button: {selector}")
-                                break
+                            await page.goto(cached["pdf_url"])
                         except Exception as e:
-                            logging.warning(f"[DOI: {doi}] Selector failed: {selector}, error: {e}")
-
-                    if not download_button:
-                        logging.warning(f"[DOI: {doi}] No download button found")
+                            # A navigation that turns into a download aborts the page load
+                            logging.debug(f"[DOI: {doi}] Cached PDF navigation: {e}")
                     else:
+                        url = f"
+                        logging.debug(f"Navigating to: {url}")
+                        response = await page.goto(url, {"waitUntil": "networkidle2"})
+                        if response is None or not response.ok:
+                            logging.error(f"[DOI: {doi}] Page load failed, status: {response.status if response else 'None'}")
+                            raise ValueError("Page load failed")
+                        landing_status = response.status
+                        logging.info(f"[DOI: {doi}] Page loaded successfully: {url}")
+
+                        download_button = await find_download_button(page, doi)
+                        if not download_button:
+                            # Nothing was clicked, so no download can start:
+                            # fail now instead of waiting out DOWNLOAD_START_TIMEOUT
+                            no_pdf_found = True
+                            raise ValueError("No download button found")
                         await download_button.click()
                         logging.info(f"[DOI: {doi}] Download button clicked")
 
-                    await asyncio.sleep(DOWNLOAD_WAIT_TIME)
+                    download_state = await watcher.wait()
+                    if download_state == "completed":
+                        logging.info(f"[DOI: {doi}] Download completed: {watcher.received_bytes} bytes")
+                    else:
+                        logging.warning(f"[DOI: {doi}] Download {download_state} after {watcher.received_bytes} bytes")
+                    logging.debug(f"[DOI: {doi}] {format_stats(blocking_stats)}")
 
                     pdf_files = [f for f in os.listdir(temp_dir) if f.lower().endswith('.pdf')]
                     if pdf_files:
                         latest_file = max(pdf_files, key=lambda f: os.path.getctime(os.path.join(temp_dir, f)))
                         file_path = os.path.join(temp_dir, latest_file)
-                        if os.path.getsize(file_path) > MIN_FILE_SIZE:
-                            new_name = f"PMID_{pmid}.pdf"
+                        pdf_state = fast_check(file_path)
+                        if pdf_state == "bad_xref":
+                            logging.warning(f"[DOI: {doi}] Downloaded PDF has a bad startxref offset, keeping it")
+                        if pdf_state in HARD_FAILURES:
+                            logging.warning(f"[DOI: {doi}] Downloaded file is not a valid PDF: {pdf_state}")
+                        elif os.path.getsize(file_path) > MIN_FILE_SIZE:
+                            new_name = pdf_name(doi, pmid)
+                            size, sha256 = file_digest(file_path)
                             shutil.move(file_path, os.path.join(DOWNLOAD_DIR, new_name))
+                            manifest.add(doi, new_name, size, sha256)
                             logging.info(f"[DOI: {doi}] Downloaded and renamed successfully: {new_name}")
                             success = True
+                            pdf_url = watcher.url or (cached["pdf_url"] if cached else None)
+                            store.add("pubmed", record_id(doi, pmid), link=pdf_url or "", raw={"DOI": doi, "file": new_name})
+                            cache.put(doi, pdf_url, landing_status, "application/pdf", size, resolver="browser")
                         else:
                             logging.warning(f"[DOI: {doi}] Downloaded file too small")
                     else:
                         logging.warning(f"[DOI: {doi}] No PDF file downloaded")
+                        no_pdf_found = landing_status is not None
             except Exception as e:
                 logging.error(f"[DOI: {doi}] Download failed: {e}")
+            if not success:
                 retries += 1
                 if retries < MAX_RETRIES:
                     await asyncio.sleep(random.uniform(RETRY_DELAY_MIN, RETRY_DELAY_MAX))
 
+    if not success and no_pdf_found:
+        cache.put(doi, None, landing_status, resolver="browser")
+
     async with lock:
         if not success:
             logging.error(f"[DOI: {doi}] Failed after {MAX_RETRIES} attempts")
-            failed_records.append({"DOI": doi, "PMID": pmid})
-            
-        # Clear to free memory
-        
-        remaining_records[:] = [r for r in remaining_records if r["DOI"] != doi]
+            failed_records[doi] = {"DOI": doi, "PMID": pmid}
+        remaining_records.pop(doi, None)
+        append_journal({
+            "DOI": doi,
+            "PMID": pmid,
+            "status": "success" if success else "failed",
+            "time": time.time()
+        })
         processed_count += 1
         if processed_count % SAVE_INTERVAL == 0:
-            save_to_excel(failed_records, FAILED_EXCEL_PATH)
-            save_to_excel(remaining_records, REMAINING_EXCEL_PATH)
+            os.fsync(journal_file.fileno())
     if pbar:
         pbar.update(1)
     return success
 
 async def process_all_dois():
-    global failed_records, remaining_records, processed_count
+    global failed_records, remaining_records, processed_count, journal_file
     try:
-        if os.path.exists(REMAINING_EXCEL_PATH):
-            remaining_df = pd.read_excel(REMAINING_EXCEL_PATH)
-            valid_dois = remaining_df["DOI"].drop_duplicates().tolist()
-            logging.info(f"Loaded {len(valid_dois)} DOIs from {REMAINING_EXCEL_PATH}")
+        manifest = DownloadManifest("pubmed")
+        outcomes, failed_records, remaining_records = load_progress(manifest)
+        valid_dois = list(remaining_records)
+        if outcomes:
+            logging.info(f"Resumed from {JOURNAL_PATH}: {len(outcomes)} DOIs done, {len(valid_dois)} remaining")
         else:
-            valid_dois = df[df["DOI"].notna() & (df["DOI"].astype(str).str.strip() != "DOI 未找到")]["DOI"].drop_duplicates().tolist()
-            remaining_records = [{"DOI": doi, "PMID": doi_pmid_map.get(doi, "Unknown_PMID")} for doi in valid_dois]
-            save_to_excel(remaining_records, REMAINING_EXCEL_PATH)
             logging.info(f"Initialized with {len(valid_dois)} DOIs")
 
         if not valid_dois:
             logging.warning("No DOIs to process, exiting")
+            manifest.close()
             return
 
         semaphore = asyncio.Semaphore(MAX_CONCURRENT_TASKS)
+        pool = BrowserPool()
+        cache = DoiCache()
+        store = ResultStore()
         async def bounded_task(doi, pbar):
             async with semaphore:
-                return await download_and_rename_pdf(doi, pbar)
+                return await download_and_rename_pdf(doi, pool, cache, store, manifest, pbar)
 
-        with tqdm(total=len(valid_dois), desc="Processing DOIs") as pbar:
-            tasks = [bounded_task(doi, pbar) for doi in valid_dois]
-            await asyncio.gather(*tasks)
+        journal_file = open(JOURNAL_PATH, "a", encoding="utf-8")
+        try:
+            with tqdm(total=len(valid_dois), desc="Processing DOIs") as pbar:
+                tasks = [bounded_task(doi, pbar) for doi in valid_dois]
+                await asyncio.gather(*tasks)
+        finally:
+            await pool.close()
+            cache.close()
+            store.close()
+            manifest.close()
+            journal_file.close()
 
-        save_to_excel(failed_records, FAILED_EXCEL_PATH)
-        save_to_excel(remaining_records, REMAINING_EXCEL_PATH)
+        save_state()
     except Exception as e:
         logging.error(f"Error processing all DOIs: {e}")
-        save_to_excel(failed_records, FAILED_EXCEL_PATH)
-        save_to_excel(remaining_records, REMAINING_EXCEL_PATH)
+        save_state()
         raise
 
 def main():
+    parser = argparse.ArgumentParser(description="Download PubMed PDFs by DOI")
+    parser.add_argument("--export", action="store_true",
+                        help="Write the failed and remaining sheets from the journal and exit without crawling")
+    args = parser.parse_args()
+    if args.export:
+        export_progress()
+        return
+
     start_time = time.time()
     logging.info("Starting PDF download task")
     try:
@@ -244,8 +522,7 @@ def main():
     except Exception as e:
         logging.error(f"Main process failed: {e}")
     finally:
-        save_to_excel(failed_records, FAILED_EXCEL_PATH)
-        save_to_excel(remaining_records, REMAINING_EXCEL_PATH)
+        save_state()
         logging.info(f"Task completed, elapsed time: {time.time() - start_time:.2f} seconds")
 
 if __name__ == "__main__":
@@ -4,8 +4,18 @@
 
 import requests  
 import pandas as pd 
-from bs4 import BeautifulSoup  
 import os  
+import re
+import codecs
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse, urljoin
+from html.parser import HTMLParser
+from requests.adapters import HTTPAdapter
+from doi_cache import DoiCache
+from result_store import ResultStore
+from pdf_validator import fast_check
 
 
 HEADERS = {
@@ -15,72 +25,234 @@ INPUT_PATH =
 OUTPUT_DIR = 
 OUTPUT_EXCEL = 
 
+# Requests opened at once per host, separately for landing checks and PDF
+# downloads so one stage never starves the other. Every landing check goes
+# through the same resolver host, so more check workers than its limit
+# would only wait on the semaphore.
+CHECK_HOST_LIMIT = 8
+DOWNLOAD_HOST_LIMIT = 4
+CHECK_WORKERS = CHECK_HOST_LIMIT
+DOWNLOAD_WORKERS = 8
+STREAM_CHUNK_SIZE = 16384
+PDF_LOOKAHEAD_BYTES = 65536
+DOWNLOAD_CHUNK_SIZE = 65536
+DOWNLOAD_TIMEOUT = (10, 60)
+DOWNLOAD_RETRIES = 3
+CONTENT_RANGE_RE = re.compile(r'bytes (\d+)-')
+
+session = requests.Session()
+session.headers.update(HEADERS)
+adapter = HTTPAdapter(pool_connections=32, pool_maxsize=CHECK_WORKERS + DOWNLOAD_WORKERS)
+session.mount("http://", adapter)
+session.mount("https://", adapter)
+
+host_limits = {}
+host_limits_lock = threading.Lock()
+
+@contextlib.contextmanager
+def host_slot(url: str, stage: str, size: int):
+    host = urlparse(url).netloc
+    with host_limits_lock:
+        limit = host_limits.setdefault((stage, host), threading.BoundedSemaphore(size))
+    with limit:
+        yield
+
+def open_stream(url: str, stage: str, size: int, **kwargs):
+    # The slot is held only until the response headers are in, so a long
+    # body does not keep other requests to the host waiting
+    with host_slot(url, stage, size):
+        return session.get(url, stream=True, **kwargs)
+
+class PdfLinkParser(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.embed_link = None
+        self.anchor_link = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'embed' and self.embed_link is None:
+            if attrs.get('type') == 'application/pdf' and attrs.get('src'):
+                self.embed_link = attrs['src']
+        elif tag == 'a' and self.anchor_link is None:
+            if '.pdf' in (attrs.get('href') or '').lower():
+                self.anchor_link = attrs['href']
+
+def extract_pdf_link(resp) -> str:
+    # Feed the page to the parser as it arrives and stop reading once the link
+    # is known. An <embed> wins over an anchor, so after the first .pdf anchor
+    # keep reading a bounded lookahead in case an embed follows.
+    parser = PdfLinkParser()
+    try:
+        decoder = codecs.getincrementaldecoder(resp.encoding or 'utf-8')(errors='replace')
+    except LookupError:
+        # A charset Python does not know; resp.text fell back the same way
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    lookahead = PDF_LOOKAHEAD_BYTES
+    for chunk in resp.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+        parser.feed(decoder.decode(chunk))
+        if parser.embed_link:
+            break
+        if parser.anchor_link:
+            lookahead -= len(chunk)
+            if lookahead <= 0:
+                break
+    return parser.embed_link or parser.anchor_link
+
 def check_url(url: str) -> dict:
     try:
-        resp = requests.get(url, headers=HEADERS, timeout=10)
-        resp.raise_for_status()
-        return {
-            'status': resp.status_code,
-            'type': resp.headers.get('Content-Type', 'Unknown'),
-            'size': resp.headers.get('Content-Length', 'Unknown'),
-            'html': resp.text
-        }
+        with open_stream(url, 'check', CHECK_HOST_LIMIT, timeout=10) as resp:
+            resp.raise_for_status()
+            content_type = resp.headers.get('Content-Type', 'Unknown')
+            result = {
+                'status': resp.status_code,
+                'type': content_type,
+                'size': resp.headers.get('Content-Length', 'Unknown'),
+            }
+            if 'application/pdf' in content_type.lower():
+                # The landing URL already is the PDF, no page to parse
+                result['pdf_link'] = resp.url
+            else:
+                link = extract_pdf_link(resp)
+                # Stored in the shared cache, so it must work without this page
+                result['pdf_link'] = urljoin(resp.url, link) if link else None
+            return result
     except requests.exceptions.RequestException as e:
-        return {'err': str(e), 'status': getattr(e.response, 'status_code', None), 'html': ''}
+        return {'err': str(e), 'status': getattr(e.response, 'status_code', None)}
+
+def range_start(resp) -> int:
+    match = CONTENT_RANGE_RE.match(resp.headers.get('Content-Range', ''))
+    return int(match.group(1)) if match else None
 
-def download_pdf(pdf_url: str, save_path: str) -> None:
+def fetch_to_part(pdf_url: str, part_path: str, chunk_size: int) -> str:
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    while True:
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        with open_stream(pdf_url, 'download', DOWNLOAD_HOST_LIMIT, headers=headers, timeout=DOWNLOAD_TIMEOUT) as resp:
+            if resp.status_code == 416:
+                # Nothing left past offset; the partial file is already whole
+                return 'complete'
+            resp.raise_for_status()
+            if 'application/pdf' not in resp.headers.get('Content-Type', ''):
+                print(f"Warning: {pdf_url} ain't PDF")
+                return 'not_pdf'
+            if resp.status_code == 206 and range_start(resp) != offset:
+                if not offset:
+                    raise ValueError(f"Unrequested range {resp.headers.get('Content-Range')}")
+                # Appending a range that does not start at offset would corrupt the file
+                print(f"Warning: {pdf_url} sent range {resp.headers.get('Content-Range')} for offset {offset}, restarting")
+                offset = 0
+                continue
+            # A plain 200 means the server ignored the Range header: start over
+            mode = 'ab' if resp.status_code == 206 else 'wb'
+            with open(part_path, mode) as f:
+                for chunk in resp.iter_content(chunk_size=chunk_size):
+                    if chunk:
+                        f.write(chunk)
+        return 'fetched'
+
+def download_pdf(pdf_url: str, save_path: str, chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> None:
+    part_path = save_path + '.part'
     try:
         if not pdf_url:
             raise ValueError("No PDF URL")
-        resp = requests.get(pdf_url, headers=HEADERS, stream=True)
-        resp.raise_for_status()
-        if 'application/pdf' not in resp.headers.get('Content-Type', ''):
-            print(f"Warning: {pdf_url} ain't PDF")
-            return
-        with open(save_path, 'wb') as f:
-            for chunk in resp.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+        for attempt in range(1, DOWNLOAD_RETRIES + 1):
+            try:
+                fetched = fetch_to_part(pdf_url, part_path, chunk_size)
+                if fetched == 'not_pdf':
+                    return
+                break
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                if attempt == DOWNLOAD_RETRIES:
+                    raise
+                print(f"Interrupted: {pdf_url}, resuming ({attempt}/{DOWNLOAD_RETRIES}), Err: {str(e)}")
+
+        state = fast_check(part_path)
+        if state == 'bad_xref':
+            print(f"Warning: {save_path} has a bad startxref offset, keeping it")
+        if state == 'bad_header' or (state == 'truncated' and fetched == 'complete'):
+            os.remove(part_path)
+            raise ValueError(f"Downloaded file failed PDF check: {state}")
+        if state == 'truncated':
+            # Keep the partial file so the next run resumes from it
+            raise ValueError("PDF is missing its %%EOF marker")
+        os.replace(part_path, save_path)
         print(f"Done: {save_path}")
-    except (requests.exceptions.RequestException, ValueError) as e:
+    except (requests.exceptions.RequestException, ValueError, OSError) as e:
         print(f"Failed: {pdf_url}, Err: {str(e)}")
 
+def record_id(doi: str, pmid) -> str:
+    # Rows and file names use the PMID; a DOI without one falls back to the
+    # DOI so those records do not all land on one "nan" row and nan.pdf
+    pmid = str(pmid).strip()
+    return pmid if pmid and pmid.lower() != 'nan' else doi
+
+def check_doi(doi: str, cache: DoiCache) -> dict:
+    url = f""
+    cached = cache.get(doi)
+    if cached:
+        return {
+            'url': url,
+            'status': cached['status'],
+            'type': cached['content_type'],
+            'size': cached['size'],
+            'pdf_link': cached['pdf_url'],
+        }
+    result = check_url(url)
+    result['url'] = url
+    if 'err' not in result:
+        cache.put(doi, result['pdf_link'], result['status'], result['type'], result['size'], resolver='static')
+    elif result['status'] in (404, 410):
+        cache.put(doi, None, result['status'], resolver='static')
+    return result
+
 def process_doi_data(df: pd.DataFrame, download_dir: str) -> pd.DataFrame:
     df['PDF_Avail'] = ''
     df['Checked_URL'] = ''
     df['PDF_Link'] = ''
 
-    for index, row in df.iterrows():
-        doi = str(row['DOI']).strip()
-        if doi and doi.lower() != 'nan':
-            url = f""
-            result = check_url(url)
-            df.at[index, 'Checked_URL'] = url
-            
+    # Check and parse landing pages in one pool; each PDF found is handed to the
+    # download pool right away so both stages overlap
+    cache = DoiCache()
+    store = ResultStore()
+    with ThreadPoolExecutor(max_workers=CHECK_WORKERS) as check_pool, \
+            ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as download_pool:
+        checks = {}
+        for index, doi, pmid in zip(df.index, df['DOI'], df['PMID']):
+            doi = str(doi).strip()
+            if doi and doi.lower() != 'nan':
+                checks[check_pool.submit(check_doi, doi, cache)] = (index, record_id(doi, pmid))
+
+        downloads = []
+        for future in as_completed(checks):
+            index, record = checks[future]
+            result = future.result()
+            df.at[index, 'Checked_URL'] = result['url']
+            store.add(
+                "pubmed_pdflink", record,
+                link=result.get('pdf_link') or '',
+                raw={'DOI': df.at[index, 'DOI'], 'Checked_URL': result['url'], 'status': result.get('status')}
+            )
+
             if 'err' in result:
                 df.at[index, 'PDF_Avail'] = 'No PDF'
-            elif 'html' in result and result['html']:
-                soup = BeautifulSoup(result['html'], 'html.parser')
-                # Look for PDF link
-                pdf_link = None
-                embed = soup.find('embed', {'type': 'application/pdf'})
-                if embed and embed.get('src'):
-                    pdf_link = embed['src']
-                else:
-                    for a in soup.find_all('a', href=True):
-                        if '.pdf' in a['href'].lower():
-                            pdf_link = a['href']
-                            break
-                
+            elif 'pdf_link' in result:
+                pdf_link = result['pdf_link']
                 if pdf_link:
                     df.at[index, 'PDF_Avail'] = 'Has PDF'
                     df.at[index, 'PDF_Link'] = pdf_link
-                    pmid = str(row['PMID'])
-                    save_path = os.path.join(download_dir, f"{pmid}.pdf")
-                    download_pdf(pdf_link, save_path)
+                    save_path = os.path.join(download_dir, re.sub(r'[\\/:*?"<>|]', '_', record) + '.pdf')
+                    downloads.append(download_pool.submit(download_pdf, pdf_link, save_path))
                 else:
                     df.at[index, 'PDF_Avail'] = 'No PDF'
-    
+
+        for future in as_completed(downloads):
+            future.result()
+
+    print(f"DOI cache: {cache.stats}")
+    cache.close()
+    store.close()
     return df
 
 def main():
@@ -88,7 +260,8 @@ def main():
     if not os.path.exists(OUTPUT_DIR):
         os.makedirs(OUTPUT_DIR)
     df = process_doi_data(df, OUTPUT_DIR)
-    df.to_excel(OUTPUT_EXCEL, index=False)
+    if OUTPUT_EXCEL:
+        df.to_excel(OUTPUT_EXCEL, index=False)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+from urllib.parse import urlparse
+
+BLOCKED_RESOURCE_TYPES = {"image", "stylesheet", "font", "media"}
+
+TRACKER_DOMAINS = [
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "googlesyndication.com",
+    "facebook.net",
+    "scorecardresearch.com",
+    "hotjar.com",
+    "hm.baidu.com",
+    "cnzz.com",
+    "51.la",
+]
+
+# Rough per-type sizes, only used to estimate the bytes a blocked request saved
+ESTIMATED_BYTES = {
+    "image": 40000,
+    "stylesheet": 30000,
+    "font": 50000,
+    "media": 200000,
+    "script": 30000,
+}
+
+
+def new_stats():
+    return {"allowed": 0, "blocked": 0, "bytes_loaded": 0, "bytes_saved": 0}
+
+
+def format_stats(stats):
+    return (
+        f"requests allowed: {stats['allowed']}, blocked: {stats['blocked']}, "
+        f"loaded: {stats['bytes_loaded'] / 1024:.1f} KB, "
+        f"saved (est.): {stats['bytes_saved'] / 1024:.1f} KB"
+    )
+
+
+def _matches(url, host, patterns):
+    for pattern in patterns:
+        if host == pattern or host.endswith("." + pattern) or pattern in url:
+            return True
+    return False
+
+
+class ResourceBlocker:
+    def __init__(self, block_types=BLOCKED_RESOURCE_TYPES, deny=TRACKER_DOMAINS, allow=()):
+        self.block_types = set(block_types)
+        self.deny = list(deny)
+        self.allow = list(allow)
+
+    def should_block(self, url, resource_type, is_navigation=False):
+        # Navigations and anything that looks like the PDF itself always go through
+        if is_navigation or resource_type == "document" or ".pdf" in url.lower():
+            return False
+        host = urlparse(url).hostname or ""
+        if _matches(url, host, self.allow):
+            return False
+        if _matches(url, host, self.deny):
+            return True
+        return resource_type in self.block_types
+
+    async def _handle(self, request, stats):
+        try:
+            if self.should_block(request.url, request.resourceType, request.isNavigationRequest()):
+                stats["blocked"] += 1
+                stats["bytes_saved"] += ESTIMATED_BYTES.get(request.resourceType, 0)
+                await request.abort()
+            else:
+                stats["allowed"] += 1
+                await request.continue_()
+        except Exception as e:
+            # The page may already be closed or the request handled elsewhere
+            logging.debug(f"Request interception error for {request.url}: {e}")
+
+    def _on_loading_finished(self, event, stats):
+        stats["bytes_loaded"] += int(event.get("encodedDataLength", 0))
+
+    async def attach(self, page):
+        stats = new_stats()
+        await page.setRequestInterception(True)
+        page.on("request", lambda request: asyncio.ensure_future(self._handle(request, stats)))
+        page._client.on("Network.loadingFinished", lambda event: self._on_loading_finished(event, stats))
+        return stats
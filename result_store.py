@@ -0,0 +1,117 @@
+import argparse
+import csv
+import json
+import time
+import logging
+from sqlite_store import SqliteStore
+
+STORE_PATH = "results.sqlite3"
+BATCH_SIZE = 500
+
+COLUMNS = ["source", "id", "query", "title", "abstract", "link", "date", "raw", "saved_at"]
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS articles ("
+    "source TEXT NOT NULL, id TEXT NOT NULL, query TEXT, title TEXT, "
+    "abstract TEXT, link TEXT, date TEXT, raw TEXT, saved_at REAL, "
+    "PRIMARY KEY (source, id))",
+    "CREATE TABLE IF NOT EXISTS resume_state (source TEXT PRIMARY KEY, state TEXT)",
+)
+
+
+class ResultStore(SqliteStore):
+    # Common article table every crawler streams into; rows are buffered and
+    # written in batches, (source, id) pairs are unique. With autoflush off
+    # rows are only written by an explicit flush(), for callers that keep the
+    # store in step with their own resume cursor; flush(source, state) then
+    # commits that cursor in the same transaction as the rows it covers.
+
+    def __init__(self, path=STORE_PATH, batch_size=BATCH_SIZE, autoflush=True):
+        self.batch_size = batch_size
+        self.autoflush = autoflush
+        self._pending = []
+        super().__init__(path, SCHEMA)
+
+    def add(self, source, id, title="", abstract="", link="", date="", query="", raw=None):
+        row = (
+            source, str(id), query, title, abstract, link, date,
+            json.dumps(raw, ensure_ascii=False, default=str), time.time()
+        )
+        with self._lock:
+            self._pending.append(row)
+            if self.autoflush and len(self._pending) >= self.batch_size:
+                self._flush_locked()
+
+    def _flush_locked(self, source=None, state=None):
+        if not self._pending and source is None:
+            return
+        with self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO articles ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                self._pending
+            )
+            if source is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO resume_state VALUES (?, ?)",
+                    (source, json.dumps(state, ensure_ascii=False))
+                )
+        logging.debug(f"Stored {len(self._pending)} articles")
+        self._pending = []
+
+    def flush(self, source=None, state=None):
+        with self._lock:
+            self._flush_locked(source, state)
+
+    def state(self, source):
+        # Resume state last committed by flush(source, state), or None
+        with self._lock:
+            row = self._conn.execute("SELECT state FROM resume_state WHERE source = ?", (source,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def rows(self, source=None):
+        self.flush()
+        query = f"SELECT {', '.join(COLUMNS)} FROM articles"
+        params = ()
+        if source:
+            query += " WHERE source = ?"
+            params = (source,)
+        with self._lock:
+            return self._conn.execute(query + " ORDER BY saved_at", params).fetchall()
+
+    def ids(self, source):
+        self.flush()
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT id FROM articles WHERE source = ?", (source,))}
+
+    def export(self, path, source=None):
+        rows = self.rows(source)
+        if path.lower().endswith((".xlsx", ".xls")):
+            import pandas as pd
+            pd.DataFrame(rows, columns=COLUMNS).to_excel(path, index=False)
+        else:
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(COLUMNS)
+                writer.writerows(rows)
+        logging.info(f"Exported {len(rows)} articles to {path}")
+        return len(rows)
+
+    def close(self):
+        self.flush()
+        super().close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export stored articles to Excel or CSV")
+    parser.add_argument("output", help="Output file (.xlsx or .csv)")
+    parser.add_argument("--store", default=STORE_PATH, help="Result store path")
+    parser.add_argument("--source", default=None, help="Only export one source, e.g. wanfang or cnki")
+    args = parser.parse_args()
+
+    store = ResultStore(args.store)
+    count = store.export(args.output, args.source)
+    store.close()
+    print(f"Exported {count} articles to {args.output}")
+
+if __name__ == "__main__":
+    main()
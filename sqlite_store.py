@@ -0,0 +1,19 @@
+import sqlite3
+import threading
+
+
+class SqliteStore:
+    # Connection, lock and close shared by the SQLite-backed stores. The
+    # connection is used from several threads, always under self._lock.
+
+    def __init__(self, path, schema=()):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        for statement in schema:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
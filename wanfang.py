@@ -11,7 +11,10 @@ from datetime import datetime
 import pandas as pd
 import requests
 from tqdm import tqdm
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
+
+from download_watcher import shared_watcher, format_download
+from download_manifest import DownloadManifest, file_digest
 
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options as ChromeOptions
@@ -56,6 +59,9 @@ def check_url_with_browser_simulation(url):
 
 
 
+DOWNLOAD_TIMEOUT = 600
+
+
 def setup_chrome_options(temp_dir):
     options = ChromeOptions()
     prefs = {
@@ -75,62 +81,62 @@ def check_for_404(driver):
     return ("404" in driver.title) or ("Not Found" in driver.page_source)
 
 
-def download_pdf(detail_url, target_dir, driver_path=None):
-    article_id = detail_url.split('/')[-1].replace('.aspx', '')
+def article_id_from_link(detail_url):
+    return detail_url.split('/')[-1].replace('.aspx', '')
+
+
+def article_id_from_file(name):
+    return name[:-4] if name.lower().endswith(".pdf") else None
+
+
+def download_pdf(detail_url, target_dir, manifest, driver_path=None):
+    article_id = article_id_from_link(detail_url)
     output_filename = f"{article_id}.pdf"
     target_path = os.path.join(target_dir, output_filename)
-    if os.path.exists(target_path):
-        logging.info(f"File already exists, skip: {target_path}")
-        return True
     temp_dir = tempfile.mkdtemp()
     options = setup_chrome_options(temp_dir)
     if driver_path:
         driver = webdriver.Chrome(executable_path=driver_path, options=options)
     else:
         driver = webdriver.Chrome(options=options)
+    watcher = shared_watcher()
+    # The detail URL starts the download itself, so watch before loading it
+    download = watcher.watch(temp_dir, suffixes=None)
     try:
         driver.get(detail_url)
         time.sleep(2)
         if check_for_404(driver):
             logging.warning(f"404 found, skip: {detail_url}")
             return False
-        timeout = 600
-        start = time.time()
-        downloaded = False
-        while time.time() - start < timeout:
-            files = os.listdir(temp_dir)
-            if files:
-                temp_file = os.path.join(temp_dir, files[0])
-                size1 = os.path.getsize(temp_file)
-                time.sleep(1)
-                size2 = os.path.getsize(temp_file)
-                if size1 == size2 and size1 > 0:
-                    shutil.move(temp_file, target_path)
-                    logging.info(f"Downloaded: {target_path}")
-                    downloaded = True
-                    break
-            time.sleep(1)
-        if not downloaded:
+        try:
+            result = download.result(timeout=DOWNLOAD_TIMEOUT)
+        except FutureTimeoutError:
             logging.error(f"Timeout downloading: {detail_url}")
             return False
+        size, sha256 = file_digest(result["path"])
+        shutil.move(result["path"], target_path)
+        manifest.add(article_id, output_filename, size, sha256)
+        logging.info(f"Downloaded: {target_path} ({format_download(result)})")
         return True
     except Exception as e:
         logging.error(f"Download error: {e} | {detail_url}")
         return False
     finally:
+        watcher.unwatch(download)
         driver.quit()
         shutil.rmtree(temp_dir, ignore_errors=True)
 
 
-def check_and_download(url, target_dir, driver_path=None):
-    if not check_url_with_browser_simulation(url):
+def check_and_download(url, target_dir, manifest, driver_path=None):
+    valid, _ = check_url_with_browser_simulation(url)
+    if not valid:
         return False
-    return download_pdf(url, target_dir, driver_path=driver_path)
+    return download_pdf(url, target_dir, manifest, driver_path=driver_path)
 
 
-def get_and_save_file_list(target_dir):
-    os.makedirs(target_dir, exist_ok=True)
-    files = [f for f in os.listdir(target_dir) if os.path.isfile(os.path.join(target_dir, f))]
+def save_file_list(target_dir, manifest):
+    # Written from the manifest instead of listing the target directory again
+    files = manifest.files()
     list_file = os.path.join(target_dir, "file_list.txt")
     with open(list_file, 'w', encoding='utf-8') as f:
         for item in files:
@@ -145,6 +151,7 @@ def main():
     parser.add_argument("--excel", default=r"", help="Excel file path (must contain 'link' column)")
     parser.add_argument("--target_dir", default=r"", help="Directory to store downloaded files")
     parser.add_argument("--threads", type=int, default=5, help="Number of download threads")
+    parser.add_argument("--driver_path", default=None, help="chromedriver path, if not on PATH")
     args = parser.parse_args()
 
     try:
@@ -170,24 +177,30 @@ def main():
         logging.warning("No valid links found.")
         return
 
-    logging.info(f"Processing {len(links)} links...")
+    manifest = DownloadManifest("wanfang")
+    manifest.seed_from_directory(args.target_dir, article_id_from_file)
+    pending = manifest.missing(links, key=article_id_from_link)
+    logging.info(f"Processing {len(pending)} links ({len(links) - len(pending)} already downloaded)...")
     futures = []
     results = []
 
-    with ThreadPoolExecutor(max_workers=args.threads) as executor:
-        with tqdm(total=len(links), desc="Processing", unit="links") as bar:
-            for link in links:
-                futures.append(executor.submit(check_and_download, link, args.target_dir, args.driver_path))
-            for fut in as_completed(futures):
-                results.append(fut.result())
-                bar.update(1)
-
-    success = sum(1 for r in results if r)
-    failure = len(results) - success
-    logging.info(f"Done. Total: {len(links)}, Success: {success}, Failure: {failure}")
-
-    file_list = get_and_save_file_list(args.target_dir)
-    logging.info(f"Downloaded files: {len(file_list)}")
+    try:
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            with tqdm(total=len(pending), desc="Processing", unit="links") as bar:
+                for link in pending:
+                    futures.append(executor.submit(check_and_download, link, args.target_dir, manifest, args.driver_path))
+                for fut in as_completed(futures):
+                    results.append(fut.result())
+                    bar.update(1)
+
+        success = sum(1 for r in results if r)
+        failure = len(results) - success
+        logging.info(f"Done. Total: {len(links)}, Skipped: {len(links) - len(pending)}, Success: {success}, Failure: {failure}")
+
+        file_list = save_file_list(args.target_dir, manifest)
+        logging.info(f"Downloaded files: {len(file_list)}")
+    finally:
+        manifest.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,170 @@
+import asyncio
+import argparse
+import contextlib
+import math
+import random
+import time
+import aiohttp
+from aiohttp import web
+
+SEARCH_URL = ""
+
+HEADERS = {
+    "User-Agent": "okhttp/3.3.1",
+    "Accept": "application/json, text/plain, */*",
+    "Connection": "keep-alive",
+    "Referer": "https://msearch.wanfangdata.com.cn/",
+}
+
+# Same retry policy as the requests Retry config in wanfang_keyword_search.py
+RETRY_STATUS = [429, 500, 502, 503, 504]
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 1
+REQUEST_TIMEOUT = 10
+POOL_SIZE = 20
+PER_HOST_LIMIT = 8
+PAGE_CONCURRENCY = 4
+
+
+def build_params(search_word, page_num, page_size):
+    return {
+        "searchWord": search_word,
+        "pageNum": page_num,
+        "pageSize": page_size,
+        "sort": '["相关度:desc"]',
+        "resultSearch": "[]",
+        "entRecFlag": "false",
+        "hasFullText": "false",
+        "isOAResource": "false",
+        "advancedSearchFlag": "true",
+    }
+
+
+class AsyncWanfangClient:
+    def __init__(self, search_url=SEARCH_URL, pool_size=POOL_SIZE, per_host=PER_HOST_LIMIT):
+        self.search_url = search_url
+        self.pool_size = pool_size
+        self.per_host = per_host
+        self.session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.per_host, ssl=False)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            headers=HEADERS,
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    async def _backoff(self, attempt):
+        await asyncio.sleep(BACKOFF_FACTOR * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+    async def get_search(self, search_word, page_num=1, page_size=50):
+        params = build_params(search_word, page_num, page_size)
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                async with self.session.get(self.search_url, params=params) as resp:
+                    if resp.status in RETRY_STATUS and attempt < MAX_RETRIES:
+                        await self._backoff(attempt)
+                        continue
+                    if resp.status == 200:
+                        jd = await resp.json(content_type=None)
+                        return jd.get("totalRow", 0), jd.get("data", [])
+                    print(f"Request failed, status code={resp.status}")
+                    return None, []
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt < MAX_RETRIES:
+                    await self._backoff(attempt)
+                    continue
+                print("Request exception:", e)
+                return None, []
+        return None, []
+
+    async def iter_pages(self, search_word, page_size=50, concurrency=PAGE_CONCURRENCY):
+        # Same contract as wanfang_keyword_search.fetch_all_pages: a page whose
+        # request failed is yielded with total_count None, and nothing after
+        # it is fetched
+        total_count, data_list = await self.get_search(search_word, 1, page_size)
+        if total_count is None:
+            yield 1, None, []
+            return
+        if not data_list:
+            return
+        yield 1, total_count, data_list
+        total_pages = math.ceil(total_count / page_size)
+        # Fetch in windows of `concurrency` pages and yield them in page order
+        for window_start in range(2, total_pages + 1, concurrency):
+            pages = range(window_start, min(window_start + concurrency, total_pages + 1))
+            results = await asyncio.gather(*(self.get_search(search_word, p, page_size) for p in pages))
+            for page_num, (page_total, data_list) in zip(pages, results):
+                if page_total is None:
+                    yield page_num, None, []
+                    return
+                yield page_num, total_count, data_list
+
+
+@contextlib.asynccontextmanager
+async def stub_server(total_rows=1000, latency=0.05, error_rate=0.0, port=0):
+    # Local stand-in for the search endpoint, for offline benchmarks
+    async def search(request):
+        await asyncio.sleep(latency)
+        if random.random() < error_rate:
+            return web.Response(status=503)
+        page_num = int(request.query.get("pageNum", 1))
+        page_size = int(request.query.get("pageSize", 50))
+        start = (page_num - 1) * page_size
+        data = [
+            {
+                "article_id": f"stub{i}",
+                "title": f"Stub article {i}",
+                "summary": "stub summary",
+                "publish_year": 2020,
+            }
+            for i in range(start, min(start + page_size, total_rows))
+        ]
+        return web.json_response({"totalRow": total_rows, "data": data})
+
+    app = web.Application()
+    app.router.add_get("/search", search)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    await site.start()
+    bound_port = runner.addresses[0][1]
+    try:
+        yield f"http://127.0.0.1:{bound_port}/search"
+    finally:
+        await runner.cleanup()
+
+
+async def benchmark(total_rows, latency, error_rate, page_size, concurrency):
+    async with stub_server(total_rows, latency, error_rate) as url:
+        async with AsyncWanfangClient(url) as client:
+            start = time.perf_counter()
+            rows = 0
+            pages = 0
+            async for page_num, page_total, data_list in client.iter_pages("benchmark", page_size, concurrency):
+                if page_total is None:
+                    print(f"Page {page_num} failed, stopping")
+                    break
+                rows += len(data_list)
+                pages += 1
+            elapsed = time.perf_counter() - start
+    print(f"Fetched {rows} rows in {pages} pages, {elapsed:.2f}s, {pages / elapsed:.1f} pages/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the async Wanfang client against a local stub server")
+    parser.add_argument("--rows", type=int, default=5000, help="Total rows served by the stub")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub response latency in seconds")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fraction of stub responses that return 503")
+    parser.add_argument("--page_size", type=int, default=50, help="Rows per page")
+    parser.add_argument("--concurrency", type=int, default=PAGE_CONCURRENCY, help="Pages fetched at once")
+    args = parser.parse_args()
+    asyncio.run(benchmark(args.rows, args.latency, args.error_rate, args.page_size, args.concurrency))
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,30 @@ import requests
 import time
 import warnings
 import csv
+import json
+import os
+import math
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from urllib3.exceptions import InsecureRequestWarning
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
+from result_store import ResultStore
 
 warnings.simplefilter('ignore', InsecureRequestWarning)
 
+EXPORT_CSV = True
+CSV_PATH = "search_results_no_duplicates.csv"
+FSYNC_INTERVAL = 10
+PAGE_WORKERS = 4
+QUERY_WORKERS = 4
+# Stop a query once this many consecutive pages bring (almost) nothing new
+DUPLICATE_PAGE_RATIO = 0.95
+DUPLICATE_PAGE_LIMIT = 2
+RATE_LIMIT = 2.0
+RATE_BURST = 4
+
 session = requests.Session()
 retry_strategy = Retry(
     total=3,
@@ -15,10 +33,32 @@ retry_strategy = Retry(
     status_forcelist=[429, 500, 502, 503, 504],
     allowed_methods=["HEAD", "GET", "OPTIONS"]
 )
-adapter = HTTPAdapter(max_retries=retry_strategy)
+adapter = HTTPAdapter(max_retries=retry_strategy, pool_maxsize=PAGE_WORKERS * QUERY_WORKERS)
 session.mount("http://", adapter)
 session.mount("https://", adapter)
 
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+rate_limiter = TokenBucket(RATE_LIMIT, RATE_BURST)
+
 def get_search(search_word, page_num=1, page_size=50):
     url =
     headers = {
@@ -39,6 +79,7 @@ def get_search(search_word, page_num=1, page_size=50):
         "isOAResource": "false",
         "advancedSearchFlag": "true",
     }
+    rate_limiter.acquire()
     try:
         resp = session.get(url, headers=headers, params=params, timeout=10, verify=False)
         if resp.status_code == 200:
@@ -48,12 +89,135 @@ def get_search(search_word, page_num=1, page_size=50):
             return total_count, data_list
         else:
             print(f"Request failed, status code={resp.status_code}")
-            return 0, []
+            return None, []
     except Exception as e:
         print("Request exception:", e)
-        return 0, []
-    finally:
-        time.sleep(2)
+        return None, []
+
+def fetch_all_pages(search_word, page_size=50, start_page=1):
+    # totalRow is a record count: derive the page count from the first page,
+    # then fetch the rest concurrently under the shared rate limit. A page
+    # whose request failed is yielded with total_count None.
+    total_count, data_list = get_search(search_word, page_num=start_page, page_size=page_size)
+    if total_count is None:
+        yield start_page, None, []
+        return
+    if not data_list:
+        return
+    yield start_page, total_count, data_list
+    total_pages = math.ceil(total_count / page_size)
+    # Keep at most PAGE_WORKERS pages in flight so a caller that stops early
+    # does not leave the rest of the query queued
+    with ThreadPoolExecutor(max_workers=PAGE_WORKERS) as executor:
+        pending = deque()
+        next_page = start_page + 1
+        while next_page <= total_pages or pending:
+            while next_page <= total_pages and len(pending) < PAGE_WORKERS:
+                pending.append((next_page, executor.submit(get_search, search_word, next_page, page_size)))
+                next_page += 1
+            page_num, future = pending.popleft()
+            page_total, page_data = future.result()
+            yield page_num, total_count if page_total is not None else None, page_data
+
+class DedupIndex:
+    # add() returns "new", "seen" (already fetched in this run) or "seeded"
+    # (saved by an earlier run); seeded ids are skipped but are no evidence
+    # that the current query has run dry
+    def __init__(self, seeded=()):
+        self.ids = set()
+        self.seeded = set(seeded)
+        self.count = len(self.seeded)
+        self.lock = threading.Lock()
+
+    def add(self, article_id):
+        with self.lock:
+            if article_id in self.ids:
+                return "seen"
+            self.ids.add(article_id)
+            if article_id in self.seeded:
+                return "seeded"
+            self.count += 1
+            return "new"
+
+    def __len__(self):
+        return self.count
+
+# Buffers each page's records and remembers the last completed page per query.
+# Every FSYNC_INTERVAL seconds the buffered rows are appended to the CSV and
+# fsynced, then the store rows and the cursor (with the synced CSV length) are
+# committed in one transaction. On resume the CSV is cut back to that length,
+# so CSV, store and cursor always cover the same pages.
+class ResultWriter:
+    def __init__(self, store, csv_path=CSV_PATH):
+        self.store = store
+        self.count = 0
+        self.lock = threading.Lock()
+        self.last_sync = time.monotonic()
+        state = store.state("wanfang") or {}
+        self.cursor = state.get("queries", {})
+        self.csv_offset = state.get("csv_offset")
+        self.rows = []
+        self.file = None
+        if csv_path:
+            if self.csv_offset is not None and os.path.exists(csv_path) and os.path.getsize(csv_path) > self.csv_offset:
+                # Rows written after the last sync belong to pages the cursor does not cover
+                os.truncate(csv_path, self.csv_offset)
+            is_new = not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0
+            self.file = open(csv_path, "a", newline="", encoding="utf-8")
+            self.writer = csv.writer(self.file)
+            if is_new:
+                self.writer.writerow(["Note", "Item", "ArticleTitle", "AbstractText", "ArticleDate", "json_content"])
+
+    def start_page(self, search_query):
+        state = self.cursor.get(search_query)
+        if state is None:
+            return 1
+        if state["done"]:
+            return None
+        return state["page"] + 1
+
+    def write_page(self, search_query, page_num, records, done=False):
+        with self.lock:
+            for item in records:
+                self.store.add(
+                    "wanfang", item["json_content"].get("article_id", "").strip(),
+                    title=item["ArticleTitle"], abstract=item["AbstractText"], link=item["Note"],
+                    date=item["ArticleDate"], query=item["item"], raw=item["json_content"]
+                )
+                if self.file:
+                    self.rows.append([
+                        item["Note"],
+                        item["item"],
+                        item["ArticleTitle"],
+                        item["AbstractText"],
+                        item["ArticleDate"],
+                        json.dumps(item["json_content"], ensure_ascii=False)
+                    ])
+            self.count += len(records)
+            self.cursor[search_query] = {"page": page_num, "done": done}
+            if time.monotonic() - self.last_sync >= FSYNC_INTERVAL:
+                self._sync()
+
+    def finish_query(self, search_query):
+        with self.lock:
+            state = self.cursor.setdefault(search_query, {"page": 0})
+            state["done"] = True
+
+    def _sync(self):
+        if self.file:
+            self.writer.writerows(self.rows)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.csv_offset = os.fstat(self.file.fileno()).st_size
+        self.rows = []
+        self.store.flush("wanfang", {"queries": self.cursor, "csv_offset": self.csv_offset})
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            self._sync()
+            if self.file:
+                self.file.close()
 
 def generate_search_queries(core_keyword, additional_keywords):
     keyword_batches = []
@@ -62,6 +226,66 @@ def generate_search_queries(core_keyword, additional_keywords):
         keyword_batches.append(query)
     return keyword_batches
 
+def run_query(search_query, fetched_article_ids, writer):
+    start_page = writer.start_page(search_query)
+    if start_page is None:
+        print(f"[{search_query}] Already completed, skipping")
+        return
+    duplicate_pages = 0
+    for current_page, total_count, data_list in fetch_all_pages(search_query, page_size=50, start_page=start_page):
+        if total_count is None:
+            # Leave the cursor before this page so the next run fetches it again
+            print(f"[{search_query}] Page {current_page} failed, stopping; it is retried on the next run")
+            return
+        new_count = 0
+        seeded_count = 0
+        page_results = []
+        for paper in data_list:
+            article_id = paper.get("article_id", "").strip()
+
+            state = fetched_article_ids.add(article_id)
+            if state == "seeded":
+                seeded_count += 1
+            if state != "new":
+                continue
+            new_count += 1
+
+            note = f"https://www.wanfangdata.com.cn/details/detail.do?_type=perio&id={article_id}"
+            abstract_text = paper.get("summary", "").strip()
+            title = paper.get("title", "").strip()
+            publish_year = paper.get("publish_year", "")
+            publish_year = str(publish_year) if isinstance(publish_year, int) else publish_year
+            article_date = f"{publish_year}" if len(publish_year) >= 4 and publish_year.isdigit() else ""
+
+            json_content = {
+                "Note": note,
+                "item": search_query,
+                "ArticleTitle": title,
+                "AbstractText": abstract_text,
+                "ArticleDate": article_date,
+                "json_content": paper
+            }
+
+            if article_id and note and abstract_text and article_date:
+                page_results.append(json_content)
+
+        writer.write_page(search_query, current_page, page_results)
+
+        print(f"[{search_query}] Page {current_page}, fetched {len(data_list)} entries, total {len(fetched_article_ids)}/{total_count}")
+
+        # Only duplicates found in this run count towards stopping early
+        considered = len(data_list) - seeded_count
+        if not considered:
+            continue
+        if new_count <= considered * (1 - DUPLICATE_PAGE_RATIO):
+            duplicate_pages += 1
+            if duplicate_pages >= DUPLICATE_PAGE_LIMIT:
+                print(f"[{search_query}] Stopping early, last {duplicate_pages} pages were already fetched")
+                break
+        else:
+            duplicate_pages = 0
+    writer.finish_query(search_query)
+
 def main():
     core_keyword = ""
     additional_keywords = [
@@ -70,66 +294,28 @@ def main():
 
     search_queries = generate_search_queries(core_keyword, additional_keywords)
 
-    fetched_article_ids = set()
-    all_results = []
+    # Only the writer's sync flushes the store, together with the cursor, so
+    # saved rows never run ahead of it and a resumed page is not mistaken for
+    # already written
+    store = ResultStore(autoflush=False)
+    # Articles saved by an earlier, interrupted run count as already fetched
+    fetched_article_ids = DedupIndex(store.ids("wanfang"))
+    writer = ResultWriter(store, CSV_PATH if EXPORT_CSV else None)
 
-    for search_query in search_queries:
-        page_size = 50
-        current_page = 1
-        total_count = 1
-
-        while current_page <= total_count:
-            total_count, data_list = get_search(search_query, page_num=current_page, page_size=page_size)
-            if not data_list:
-                break
-
-            for paper in data_list:
-                article_id = paper.get("article_id", "").strip()
-                
-                if article_id in fetched_article_ids:
-                    continue
-                
-                fetched_article_ids.add(article_id)
-
-                note = f"https://www.wanfangdata.com.cn/details/detail.do?_type=perio&id={article_id}"
-                abstract_text = paper.get("summary", "").strip()
-                title = paper.get("title", "").strip()
-                publish_year = paper.get("publish_year", "")
-                publish_year = str(publish_year) if isinstance(publish_year, int) else publish_year
-                article_date = f"{publish_year}" if len(publish_year) >= 4 and publish_year.isdigit() else ""
-
-                json_content = {
-                    "Note": note,
-                    "item": search_query,
-                    "ArticleTitle": title,
-                    "AbstractText": abstract_text,
-                    "ArticleDate": article_date,
-                    "json_content": paper
-                }
-
-                if article_id and note and abstract_text and article_date:
-                    all_results.append(json_content)
-
-            print(f"Page {current_page}, fetched {len(data_list)} entries, total {len(all_results)}/{total_count}")
-            current_page += 1
-
-    print(f"\nFetched {len(all_results)} records in total.")
-
-    csv_filename = "search_results_no_duplicates.csv"
-    with open(csv_filename, "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["Note", "Item", "ArticleTitle", "AbstractText", "ArticleDate", "json_content"])
-        for item in all_results:
-            writer.writerow([
-                item["Note"],
-                item["item"],
-                item["ArticleTitle"],
-                item["AbstractText"],
-                item["ArticleDate"],
-                str(item["json_content"])
-            ])
-
-    print(f"Results saved locally to {csv_filename}.")
+    try:
+        with ThreadPoolExecutor(max_workers=QUERY_WORKERS) as executor:
+            futures = [
+                executor.submit(run_query, search_query, fetched_article_ids, writer)
+                for search_query in search_queries
+            ]
+            for future in futures:
+                future.result()
+    finally:
+        writer.close()
+        store.close()
+    print(f"\nFetched {writer.count} new records in total.")
+    if EXPORT_CSV:
+        print(f"Results saved locally to {CSV_PATH}.")
 
 if __name__ == "__main__":
     main()